@@ -5,7 +5,14 @@ Initial system launch configuration file
 from flask import Flask, render_template
 from flask_login import current_user
 from app.extensions import db, login_manager, migrate
-from app.utils.logging import setup_logger, setup_audit_logger
+from app.commands import register_commands
+from app.services.counters import init_row_counters
+from app.services.identity import identity_cache
+from app.utils.logging import setup_logger, setup_audit_logger, setup_slow_query_logger
+from app.utils.audit_writer import audit_writer
+from app.utils.metrics import metrics
+from app.utils.profiling import init_sql_profiler
+from app.utils.query_guard import init_query_guard
 from app.models.user import User
 from app.models import init_default_data
 from app.views.audit import auditlog_bp
@@ -32,13 +39,22 @@ def create_app(config_class='default'):
     # Set up logging
     setup_logger(app)
     setup_audit_logger(app)
+    setup_slow_query_logger(app)
 
     # Database and other Extension Initialization
     db.init_app(app)
     migrate.init_app(app, db)
+    init_row_counters(app)
+    audit_writer.init_app(app)
+    identity_cache.init_app(app)
+    init_query_guard(app)
+    init_sql_profiler(app)
+    metrics.init_app(app)
     login_manager.init_app(app)
     login_manager.login_view = 'auth.login'
 
+    # Register the app CLI commands
+    register_commands(app)
 
 
     # Registration of the App Blueprint View Routes
@@ -95,9 +111,9 @@ def create_app(config_class='default'):
     @login_manager.user_loader
     def load_user(user_id):
         """
-        A function to load a logged in user
+        A function to load a logged in user, with its role, from the identity cache
         """
-        return User.query.get(user_id)
+        return identity_cache.load(user_id)
 
 
     # Register error handlers
@@ -106,6 +122,10 @@ def create_app(config_class='default'):
 
 
     with app.app_context():
+        if db.engine.dialect.name == 'sqlite' and app.config['SQLITE_JOURNAL_MODE']:
+            with db.engine.connect() as connection:
+                connection.exec_driver_sql(
+                    f"PRAGMA journal_mode = {app.config['SQLITE_JOURNAL_MODE']}")
         db.create_all()
         init_default_data()
 
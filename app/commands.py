@@ -0,0 +1,257 @@
+"""
+Flask CLI commands configuration file
+"""
+
+import os
+import time
+import random
+import tempfile
+from datetime import date, datetime, timedelta
+import click
+from flask.cli import AppGroup
+from sqlalchemy import create_engine, func, or_, select
+from app.extensions import db
+from app.models.shared import generate_uuid
+from app.models.transaction import Transaction, TType
+from app.models.user import User
+from app.services.audit_archive import archive_cold_months, ensure_partitions
+from app.services.exchange import load_rates, read_rates_csv
+from app.services.rollup import rebuild_rollups
+from app.services.summary import period_summary_statement
+from app.services.transaction_import import IMPORT_FORMATS, import_transactions
+from app.utils.money import Money
+from app.utils.periods import month_range
+
+
+def register_commands(app):
+    """
+    A function to register the app CLI commands
+    """
+    app.cli.add_command(benchmark_transactions)
+    app.cli.add_command(rebuild_rollups_command)
+    app.cli.add_command(import_transactions_command)
+    app.cli.add_command(audit_cli)
+    app.cli.add_command(rates_cli)
+
+
+def _time_query(connection, statement, repeat):
+    """
+    Run a statement a number of times and return the best elapsed time in ms
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        connection.execute(statement).all()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def _benchmark_statements(user_id):
+    """
+    Build the dashboard and listing statements measured by the benchmark
+    """
+    table = Transaction.__table__
+    return {
+        'dashboard_summary': period_summary_statement(user_id, *month_range()),
+        'dashboard_recent': select(table).where(table.c.user_id == user_id)
+                            .order_by(table.c.date.desc()).limit(5),
+        'listing_page': select(table).where(table.c.user_id == user_id)
+                        .order_by(table.c.created_at.desc()).limit(15),
+        'listing_count': select(func.count()).select_from(table)
+                         .where(table.c.user_id == user_id),
+    }
+
+
+@click.command('benchmark-transactions')
+@click.option('--rows', default=5_000_000, show_default=True,
+              help='Number of transactions to seed.')
+@click.option('--users', default=50, show_default=True,
+              help='Number of users the rows are spread across.')
+@click.option('--repeat', default=5, show_default=True,
+              help='Runs per query, the best time is reported.')
+@click.option('--database', default=None,
+              help='SQLite file to seed, a temporary file is used by default.')
+def benchmark_transactions(rows, users, repeat, database):
+    """
+    Seed a SQLite database with transactions and report dashboard and listing
+    latency without and with the transactions table indexes
+    """
+    path = database or os.path.join(tempfile.mkdtemp(), 'benchmark.db')
+    engine = create_engine(f'sqlite:///{path}')
+    table = Transaction.__table__
+
+    db.metadata.create_all(engine)
+    with engine.begin() as connection:
+        for index in table.indexes:
+            index.drop(connection, checkfirst=True)
+
+    user_ids = [generate_uuid() for _ in range(users)]
+    category_ids = [generate_uuid() for _ in range(10)]
+    today = date.today()
+    batch_size = 50_000
+
+    click.echo(f'Seeding {rows:,} transactions into {path}')
+    start = time.perf_counter()
+    with engine.begin() as connection:
+        for offset in range(0, rows, batch_size):
+            batch = []
+            for _ in range(min(batch_size, rows - offset)):
+                day = today - timedelta(days=random.randint(0, 365 * 3))
+                batch.append({
+                    'id': generate_uuid(),
+                    'category_id': random.choice(category_ids),
+                    'amount': Money(random.randint(100, 500_000)),
+                    'description': 'benchmark',
+                    'transaction_type': random.choice(list(TType)),
+                    'date': day,
+                    'created_at': datetime.combine(day, datetime.min.time()),
+                    'user_id': random.choice(user_ids),
+                })
+            connection.execute(table.insert(), batch)
+    click.echo(f'Seeded in {time.perf_counter() - start:.1f}s')
+
+    statements = _benchmark_statements(user_ids[0])
+    results = {}
+    with engine.connect() as connection:
+        for name, statement in statements.items():
+            results[name] = [_time_query(connection, statement, repeat)]
+
+    start = time.perf_counter()
+    with engine.begin() as connection:
+        for index in table.indexes:
+            index.create(connection)
+        connection.exec_driver_sql('ANALYZE')
+    click.echo(f'Indexes built in {time.perf_counter() - start:.1f}s')
+
+    with engine.connect() as connection:
+        for name, statement in statements.items():
+            results[name].append(_time_query(connection, statement, repeat))
+
+        click.echo('Query plans with indexes:')
+        for name, statement in statements.items():
+            compiled = statement.compile(connection, compile_kwargs={'literal_binds': True})
+            plan = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {compiled}').all()
+            click.echo(f'  {name}: ' + '; '.join(row[-1] for row in plan))
+
+    click.echo(f'{"query":<20}{"before (ms)":>14}{"after (ms)":>14}')
+    for name, (before, after) in results.items():
+        click.echo(f'{name:<20}{before:>14.2f}{after:>14.2f}')
+
+    engine.dispose()
+    if not database:
+        os.remove(path)
+
+
+@click.command('rebuild-rollups')
+@click.option('--user', 'user_id', default=None,
+              help='Only rebuild the summaries of this user id.')
+def rebuild_rollups_command(user_id):
+    """
+    Backfill the monthly summaries from the transactions table
+    """
+    start = time.perf_counter()
+    rows = rebuild_rollups(user_id)
+    click.echo(f'Rebuilt {rows:,} monthly summaries in {time.perf_counter() - start:.1f}s')
+
+
+
+@click.command('import-transactions')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--user', 'user', required=True,
+              help='Id, username or email of the user the transactions belong to.')
+@click.option('--format', 'file_format', type=click.Choice(IMPORT_FORMATS), default=None,
+              help='File format, guessed from the file extension by default.')
+@click.option('--default-category', default=None,
+              help='Category name of the rows without one, such as OFX transactions.')
+@click.option('--errors', 'error_path', default=None,
+              help='CSV file of the rejected rows, PATH.errors.csv by default.')
+@click.option('--chunk-size', default=None, type=int,
+              help='Rows inserted per transaction, IMPORT_CHUNK_SIZE by default.')
+@click.option('--currency', default=None,
+              help='Currency of the rows without one, the user base currency by default.')
+def import_transactions_command(path, user, file_format, default_category, error_path,
+                                chunk_size, currency):
+    """
+    Bulk import the transactions of a bank CSV or OFX statement
+    """
+    account = db.session.execute(
+        select(User.id, User.currency)
+        .where(or_(User.id == user, User.username == user, User.email == user))
+    ).first()
+    if account is None:
+        raise click.ClickException(f'Unknown user {user}')
+
+    file_format = file_format or ('csv' if path.lower().endswith('.csv') else 'ofx')
+    error_path = error_path or f'{path}.errors.csv'
+    with open(path, encoding='utf-8-sig', newline='') as stream:
+        try:
+            report = import_transactions(stream, file_format, account.id,
+                                         error_path=error_path,
+                                         default_category=default_category,
+                                         chunk_size=chunk_size,
+                                         currency=(currency or account.currency).upper())
+        except ValueError as exc:
+            raise click.ClickException(str(exc)) from exc
+
+    click.echo(str(report))
+    if report.error_path:
+        click.echo(f'Rejected rows written to {report.error_path}')
+
+
+audit_cli = AppGroup('audit', help='Audit log retention commands.')
+
+
+@audit_cli.command('archive')
+@click.option('--dry-run', is_flag=True, help='Only list the months that would be archived.')
+def audit_archive(dry_run):
+    """
+    Archive the audit log months older than AUDIT_RETENTION_DAYS to compressed
+    JSONL files and remove them from the database
+    """
+    archived = archive_cold_months(dry_run=dry_run)
+    if not archived:
+        click.echo('No audit log months to archive')
+    for month_start, path, count in archived:
+        if dry_run:
+            click.echo(f'Would archive {month_start:%Y-%m}')
+        else:
+            click.echo(f'Archived {count:,} audit logs of {month_start:%Y-%m} to {path}')
+
+
+@audit_cli.command('partitions')
+@click.option('--months-ahead', default=2, show_default=True,
+              help='Number of future monthly partitions to create.')
+def audit_partitions(months_ahead):
+    """
+    Create the upcoming monthly audit log partitions on PostgreSQL
+    """
+    with db.engine.begin() as connection:
+        created = ensure_partitions(connection, months_ahead)
+    click.echo(f'Created partitions: {", ".join(created)}' if created
+               else 'No partitions to create')
+
+
+rates_cli = AppGroup('rates', help='Exchange rate commands.')
+
+
+@rates_cli.command('load')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+def rates_load(path):
+    """
+    Load the exchange rates of a CSV file with date, pair (USD/KES) and rate
+    columns, filling the days between the rates and adding the inverse pairs
+    """
+    with open(path, encoding='utf-8-sig', newline='') as stream:
+        try:
+            rates = read_rates_csv(stream)
+        except ValueError as exc:
+            raise click.ClickException(str(exc)) from exc
+    if not rates:
+        raise click.ClickException(f'No rates in {path}')
+
+    written = load_rates(rates)
+    pairs = ', '.join(f'{base}/{quote}' for base, quote in sorted(rates))
+    click.echo(f'Loaded {written:,} daily rates of {pairs} and their inverses')
+
+# End of file
@@ -3,6 +3,8 @@ Base form defination file to be shared with all system forms
 """
 
 from flask_wtf import FlaskForm
+from wtforms import DecimalField
+from app.utils.money import Money
 
 class BaseForm(FlaskForm):
     """
@@ -18,4 +20,24 @@ class BaseForm(FlaskForm):
                         field.label.text = field.label.text + ' *'
                         break
 
+
+class MoneyField(DecimalField):
+    """
+    Amount input whose data is a Money, parsed exactly to the cent
+    """
+    def process_formdata(self, valuelist):
+        if not valuelist or not valuelist[0].strip():
+            self.data = None
+            return
+        try:
+            self.data = Money.parse(valuelist[0])
+        except ValueError as exc:
+            self.data = None
+            raise ValueError(self.gettext('Not a valid amount.')) from exc
+
+    def _value(self):
+        if self.raw_data:
+            return self.raw_data[0]
+        return str(self.data) if self.data is not None else ''
+
 # End of file
@@ -3,10 +3,11 @@ Transaction form defination file
 """
 
 from flask_wtf import FlaskForm
-from wtforms import SelectField, FloatField, TextAreaField
+from flask_wtf.file import FileAllowed, FileField, FileRequired
+from wtforms import SelectField, TextAreaField
 from wtforms.validators import DataRequired
 from app.models.transaction import TType
-from app.forms.shared import BaseForm
+from app.forms.shared import BaseForm, MoneyField
 
 
 class TransactionForm(BaseForm):
@@ -17,10 +18,14 @@ class TransactionForm(BaseForm):
                            render_kw={"placeholder":"Category",
                                       "class":"form-control form-select",
                                       "required":"required"})
-    amount = FloatField("Amount", validators=[DataRequired()],
+    amount = MoneyField("Amount", validators=[DataRequired()],
                         render_kw={"placeholder":"Amount",
-                                   "type":"number", "class":"form-control",
+                                   "type":"number", "step":"0.01", "class":"form-control",
                                    "required":"required"})
+    currency = SelectField("Currency", validators=[DataRequired()],
+                           render_kw={"placeholder":"Currency",
+                                      "class":"form-control form-select",
+                                      "required":"required"})
     description = TextAreaField("Description", validators=[DataRequired()],
                                 render_kw={"placeholder": "Description",
                                            "type":"text",
@@ -33,6 +38,19 @@ class TransactionForm(BaseForm):
                                               "required":"required"})
 
 
+class TransactionImportForm(BaseForm):
+    """
+    Transaction bulk import form defination
+    """
+    file = FileField("Bank Statement (CSV or OFX)",
+                     validators=[FileRequired(), FileAllowed(['csv', 'ofx', 'qfx'])],
+                     render_kw={"class":"form-control", "accept":".csv,.ofx,.qfx"})
+    default_category = SelectField("Category of rows without one", coerce=str,
+                                   render_kw={"class":"form-control form-select"})
+    currency = SelectField("Currency of rows without one",
+                           render_kw={"class":"form-control form-select"})
+
+
 class TransactionDetailsForm(FlaskForm):
     """
     Transaction form defination
@@ -40,9 +58,12 @@ class TransactionDetailsForm(FlaskForm):
     category = SelectField("Category", coerce=str, render_kw={"placeholder":"First Name",
                                                               "class":"form-control fw-bold",
                                                               "readonly":"readonly", "disabled":"True"})
-    amount = FloatField("Amount", render_kw={"placeholder":"First Name",
+    amount = MoneyField("Amount", render_kw={"placeholder":"First Name",
                                              "class":"form-control fw-bold",
                                              "readonly":"readonly", "disabled":"True"})
+    currency = SelectField("Currency", render_kw={"placeholder":"Currency",
+                                                  "class":"form-control fw-bold",
+                                                  "readonly":"readonly", "disabled":"True"})
     description = TextAreaField("Description", render_kw={"placeholder":"First Name",
                                                           "class":"form-control fw-bold",
                                                           "readonly":"readonly", "disabled":"True"})
@@ -93,6 +93,10 @@ class UserUpdateForm(BaseForm):
                         render_kw={"placeholder":"Email",
                                    "type":"email", "class":"form-control",
                                    "required":"required"})
+    currency = SelectField("Base Currency", validators=[DataRequired()],
+                           render_kw={"placeholder":"Base Currency",
+                                      "class":"form-control form-select",
+                                      "required":"required"})
 
 
 # End of file
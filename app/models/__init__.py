@@ -12,14 +12,20 @@ from app.models.user import User, UserStatus
 # Other Models
 from app.models.category import Category
 from app.models.transaction import Transaction, TType
+from app.models.summary import MonthlySummary
+from app.models.rowcount import RowCount
+from app.models.cache_version import CacheVersion
+from app.models.exchange_rate import ExchangeRate
 
 
 def init_default_data():
     """
     A function to setup database and initialize table with default data
     """
+    # Only the ids are selected, the app starts on databases not yet upgraded
+    # to the columns added by later migrations
     # Check if roles already exist if not create role ADMIN and USER
-    if not Role.query.first():
+    if not db.session.query(Role.id).first():
         admin_role = Role(name='ADMIN', created_by='superadmin', updated_by='superadmin')
         user_role = Role(name='USER', created_by='superadmin', updated_by='superadmin')
 
@@ -30,7 +36,7 @@ def init_default_data():
         print('Roles created successfully!')
 
     # Check if users already exist if not create admin user
-    if not User.query.first():
+    if not db.session.query(User.id).first():
         admin_user = User(firstname='Super',
                           lastname='Admin',
                           fullname='Super Admin',
@@ -62,7 +68,7 @@ def init_default_data():
         print('System Users is created successfully!')
 
     # Check if categories already exist if not create defaults
-    if not Category.query.first():
+    if not db.session.query(Category.id).first():
         default_categories = [
             Category(name='Food & Dining', description='Food Stuff', icon='🍽️',
                      user_id=admin_user.id),
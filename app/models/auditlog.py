@@ -11,6 +11,10 @@ class Auditlog(db.Model, TimeStampMixin):
     Audit Log model defination
     """
     __tablename__ = 'auditlogs'
+    __table_args__ = (
+        # Retention window listings, and the partition key on PostgreSQL
+        db.Index('ix_auditlogs_created_at', 'created_at'),
+    )
     id = db.Column(db.String(36), primary_key=True, default=generate_uuid)
     timestamp = db.Column(db.DateTime, nullable=False, default=datetime.now())
     user_id = db.Column(db.String(50), nullable=True)
@@ -22,6 +26,8 @@ class Auditlog(db.Model, TimeStampMixin):
     user_agent = db.Column(db.String(200), nullable=True)
     request_id = db.Column(db.String(36), nullable=False)
     details = db.Column(db.Text, nullable=True)
+    # Loaded by the full-text search with the rank of each match
+    search_rank = db.query_expression()
 
     def __repr__(self):
         return f'<Auditlog {self.action} by {self.user_id} at {self.timestamp}>'
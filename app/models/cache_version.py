@@ -0,0 +1,19 @@
+"""
+Cache Version model class defination file
+"""
+
+from app.extensions import db
+
+class CacheVersion(db.Model):
+    """
+    Cache Version model defination, named counters bumped on every write of
+    the data a process cache holds so all the processes drop their copies
+    """
+    __tablename__ = 'cache_versions'
+    name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<CacheVersion {self.name} {self.version}>'
+
+# End of file
@@ -0,0 +1,34 @@
+"""
+Exchange Rate model class defination file
+"""
+
+from app.extensions import db
+
+class ExchangeRate(db.Model):
+    """
+    Exchange Rate model defination, the price in the quote currency of one
+    unit of the base currency on a day, every day of a loaded pair has a row
+    so amounts are converted with an equality join on (pair, date)
+    """
+    __tablename__ = 'exchange_rates'
+    __table_args__ = (
+        # The latest load, the version of the cached rates
+        db.Index('ix_exchange_rates_loaded_at', 'loaded_at'),
+    )
+    base = db.Column(db.String(3), primary_key=True)
+    quote = db.Column(db.String(3), primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+    rate = db.Column(db.Numeric(20, 10), nullable=False)
+    loaded_at = db.Column(db.DateTime, nullable=True)
+
+    @property
+    def pair(self):
+        """
+        Return the currency pair of the rate, such as USD/KES
+        """
+        return f'{self.base}/{self.quote}'
+
+    def __repr__(self):
+        return f'<ExchangeRate {self.pair} {self.date} {self.rate}>'
+
+# End of file
@@ -0,0 +1,19 @@
+"""
+Row Count model class defination file
+"""
+
+from app.extensions import db
+
+class RowCount(db.Model):
+    """
+    Row Count model defination, exact row counters of the small tables kept
+    current on every insert and delete
+    """
+    __tablename__ = 'row_counts'
+    table_name = db.Column(db.String(64), primary_key=True)
+    count = db.Column(db.BigInteger, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<RowCount {self.table_name} {self.count}>'
+
+# End of file
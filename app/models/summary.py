@@ -0,0 +1,134 @@
+"""
+Monthly Summary model class defination file
+"""
+
+from collections import defaultdict
+from sqlalchemy import event, inspect
+from app.extensions import db
+from app.models.transaction import Transaction, TType
+from app.utils.money import Money, MoneyType
+
+class MonthlySummary(db.Model):
+    """
+    Monthly Summary model defination, a rollup of transaction totals per user,
+    month, category and transaction type kept current on every write
+    """
+    __tablename__ = 'monthly_summaries'
+    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), primary_key=True)
+    year = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    month = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    category_id = db.Column(db.String(36), db.ForeignKey('categories.id'), primary_key=True)
+    transaction_type = db.Column(db.Enum(TType), primary_key=True)
+    currency = db.Column(db.String(3), primary_key=True)
+    total = db.Column(MoneyType, nullable=False, default=Money(0))
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<MonthlySummary {self.user_id} {self.year}-{self.month:02d}>'
+
+
+ROLLUP_FIELDS = ('user_id', 'category_id', 'date', 'transaction_type', 'currency', 'amount')
+
+
+def rollup_key(user_id, category_id, date, transaction_type, currency):
+    """
+    A function to build the monthly summary key of a transaction
+    """
+    if isinstance(transaction_type, str):
+        transaction_type = TType[transaction_type]
+    return (user_id, date.year, date.month, category_id, transaction_type, currency)
+
+
+def apply_rollup_deltas(connection, deltas):
+    """
+    Apply (key, amount, count) deltas to the monthly summaries, merging
+    deltas that share a key so each summary row is written once
+    """
+    merged = defaultdict(lambda: [Money(0), 0])
+    for key, amount, count in deltas:
+        merged[key][0] += amount
+        merged[key][1] += count
+
+    table = MonthlySummary.__table__
+    for (user_id, year, month, category_id, ttype, currency), (amount, count) in merged.items():
+        if not amount and not count:
+            continue
+        where = (
+            (table.c.user_id == user_id) &
+            (table.c.year == year) &
+            (table.c.month == month) &
+            (table.c.category_id == category_id) &
+            (table.c.transaction_type == ttype) &
+            (table.c.currency == currency)
+        )
+        result = connection.execute(
+            table.update().where(where).values(total=table.c.total + amount,
+                                               count=table.c.count + count))
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(user_id=user_id,
+                                                     year=year,
+                                                     month=month,
+                                                     category_id=category_id,
+                                                     transaction_type=ttype,
+                                                     currency=currency,
+                                                     total=amount,
+                                                     count=count))
+
+
+def _transaction_key(target):
+    """
+    A function to build the monthly summary key of a transaction instance
+    """
+    return rollup_key(target.user_id, target.category_id, target.date,
+                      target.transaction_type, target.currency)
+
+
+def _load_old_value(target, value, oldvalue, initiator):
+    """
+    Keep the replaced value of a rollup field, registered with active_history
+    so the old value is loaded even when the attribute was expired
+    """
+
+
+for _field in ROLLUP_FIELDS:
+    event.listen(getattr(Transaction, _field), 'set', _load_old_value,
+                 active_history=True)
+
+
+@event.listens_for(Transaction, 'after_insert')
+def _rollup_after_insert(mapper, connection, target):
+    """
+    Add an inserted transaction to its monthly summary
+    """
+    apply_rollup_deltas(connection, [(_transaction_key(target), target.amount, 1)])
+
+
+@event.listens_for(Transaction, 'after_delete')
+def _rollup_after_delete(mapper, connection, target):
+    """
+    Remove a deleted transaction from its monthly summary
+    """
+    apply_rollup_deltas(connection, [(_transaction_key(target), -target.amount, -1)])
+
+
+@event.listens_for(Transaction, 'after_update')
+def _rollup_after_update(mapper, connection, target):
+    """
+    Move an updated transaction from its old monthly summary to its new one
+    """
+    state = inspect(target)
+    old = {}
+    for field in ROLLUP_FIELDS:
+        history = state.attrs[field].history
+        old[field] = history.deleted[0] if history.deleted else getattr(target, field)
+
+    old_key = rollup_key(old['user_id'], old['category_id'], old['date'],
+                         old['transaction_type'], old['currency'])
+    new_key = _transaction_key(target)
+    if old_key == new_key and old['amount'] == target.amount:
+        return
+
+    apply_rollup_deltas(connection, [(old_key, -old['amount'], -1),
+                                     (new_key, target.amount, 1)])
+
+# End of file
@@ -4,8 +4,10 @@ Transaction model class defination file
 
 from enum import Enum
 from datetime import datetime
+from sqlalchemy.orm import validates
 from app.extensions import db
 from app.models.shared import generate_uuid
+from app.utils.money import Money, MoneyType
 
 class TType(Enum):
     """
@@ -19,18 +21,46 @@ class Transaction(db.Model):
     Transaction model defination
     """
     __tablename__ = 'transactions'
+    __table_args__ = (
+        # Dashboard period summaries and recent transactions per user (type and
+        # amount are trailing so the summary is answered from the index alone)
+        db.Index('ix_transactions_user_date_type_amount',
+                 'user_id', 'date', 'transaction_type', 'amount'),
+        # Covering index for the monthly income/expense sums (amount is trailing
+        # so the aggregate is answered from the index without touching the table)
+        db.Index('ix_transactions_user_type_date_amount',
+                 'user_id', 'transaction_type', 'date', 'amount'),
+        # Listing views sorted by creation time, scoped and unscoped
+        db.Index('ix_transactions_user_created_at', 'user_id', 'created_at'),
+        # Latest change of a user's transactions, the cash-flow ETag
+        db.Index('ix_transactions_user_updated_at', 'user_id', 'updated_at'),
+        db.Index('ix_transactions_created_at', 'created_at'),
+        db.Index('ix_transactions_category_id', 'category_id'),
+        # Exact and range amount searches of the listing
+        db.Index('ix_transactions_amount', 'amount'),
+    )
     id = db.Column(db.String(36), primary_key=True, default=generate_uuid)
     category_id = db.Column(db.String(36), db.ForeignKey('categories.id'), nullable=False)
-    amount = db.Column(db.Float, nullable=False)
+    # Integer cents read and written as Money
+    amount = db.Column(MoneyType, nullable=False)
+    currency = db.Column(db.String(3), nullable=False, default='USD')
     description = db.Column(db.Text, nullable=False)
     transaction_type = db.Column(db.Enum(TType), nullable=False)
     date = db.Column(db.Date, nullable=False, default=datetime.now().date())
     created_at = db.Column(db.DateTime, default=datetime.now())
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
     user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
     # Relationship
     category = db.relationship('Category', backref='transactions')
     user = db.relationship('User', backref='transactions')
 
+    @validates('amount')
+    def validate_amount(self, key, value):
+        """
+        Keep the amount a Money whatever number type it is assigned
+        """
+        return Money.parse(value) if value is not None else None
+
     def __repr__(self):
         return f'<Transaction {self.category_id}>'
 
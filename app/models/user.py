@@ -34,6 +34,8 @@ class User(db.Model, UserMixin, TimeStampMixin):
     is_2fa_enabled = db.Column(db.Boolean, default=False)
     two_factor_secret = db.Column(db.String(36), unique=True, nullable=True)
     last_login = db.Column(db.DateTime, nullable=True)
+    # Base currency the dashboard totals are converted to
+    currency = db.Column(db.String(3), nullable=False, default='USD')
     # Relationship
     role = db.relationship('Role', backref='users')
 
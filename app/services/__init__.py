@@ -0,0 +1,13 @@
+"""
+Services package for database backed business logic shared across views
+"""
+
+from app.services.rollup import rebuild_rollups
+from app.services.summary import summarize_period
+
+__all__ = [
+    'rebuild_rollups',
+    'summarize_period'
+]
+
+# End of file
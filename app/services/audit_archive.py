@@ -0,0 +1,195 @@
+"""
+Audit log partitioning, retention and archiving services.
+
+On PostgreSQL the auditlogs table is natively partitioned by month on
+created_at, so cold months are detached and dropped once archived and the
+planner prunes partitions outside the queried window. Other databases keep a
+single hot table indexed on created_at whose size is bounded by the retention
+window, cold months being deleted once archived.
+"""
+
+import os
+import gzip
+import json
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import func, select, text
+from app.extensions import db
+from app.models.auditlog import Auditlog
+from app.utils.periods import month_range
+
+
+def retention_cutoff():
+    """
+    Return the oldest created_at kept in the hot audit log
+    """
+    return datetime.now() - timedelta(days=current_app.config['AUDIT_RETENTION_DAYS'])
+
+
+def hot_window_filter():
+    """
+    Build the listing predicate restricting audit logs to the retention window,
+    which lets PostgreSQL prune the cold partitions
+    """
+    return Auditlog.created_at >= retention_cutoff()
+
+
+def month_bounds(month_start):
+    """
+    Return the half-open [start, end) datetime range of a month
+    """
+    start, end = month_range(month_start)
+    return (datetime.combine(start, datetime.min.time()),
+            datetime.combine(end, datetime.min.time()))
+
+
+def partition_name(month_start):
+    """
+    Return the name of the partition holding a month
+    """
+    return f'auditlogs_{month_start.year}_{month_start.month:02d}'
+
+
+def is_partitioned(connection):
+    """
+    Check if the auditlogs table is a PostgreSQL partitioned table
+    """
+    if connection.dialect.name != 'postgresql':
+        return False
+    return bool(connection.execute(text(
+        "SELECT 1 FROM pg_partitioned_table "
+        "WHERE partrelid = to_regclass('auditlogs')")).scalar())
+
+
+def ensure_partitions(connection, months_ahead=2):
+    """
+    Create the monthly partitions from the current month up to months_ahead,
+    returning the names of the partitions created
+    """
+    if not is_partitioned(connection):
+        return []
+
+    created = []
+    month_start, month_end = month_range()
+    for _ in range(months_ahead + 1):
+        name = partition_name(month_start)
+        exists = connection.execute(text("SELECT to_regclass(:name)"),
+                                    {'name': name}).scalar()
+        if not exists:
+            connection.execute(text(
+                f"CREATE TABLE {name} PARTITION OF auditlogs "
+                f"FOR VALUES FROM ('{month_start}') TO ('{month_end}')"))
+            created.append(name)
+        month_start, month_end = month_range(month_end)
+    return created
+
+
+def cold_months(connection, cutoff):
+    """
+    Return the start dates of the whole months older than the cutoff that
+    still hold audit logs
+    """
+    first_hot_month = month_bounds(cutoff)[0]
+    oldest = connection.execute(
+        select(func.min(Auditlog.created_at))
+        .where(Auditlog.created_at < first_hot_month)).scalar()
+    if oldest is None:
+        return []
+
+    if isinstance(oldest, str):
+        # SQLite returns the raw column value of an aggregate
+        oldest = datetime.fromisoformat(oldest)
+
+    months = []
+    month_start = month_range(oldest)[0]
+    while month_start < first_hot_month.date():
+        months.append(month_start)
+        month_start = month_range(month_start)[1]
+    return months
+
+
+def export_month(connection, month_start, archive_dir):
+    """
+    Write the audit logs of a month to its gzip compressed JSONL archive,
+    returning the archive path and the number of rows added. The rows of an
+    existing archive are kept and not written twice, so a run interrupted
+    before the delete can be repeated, and the new archive replaces the old
+    one only once complete
+    """
+    start, end = month_bounds(month_start)
+    path = os.path.join(archive_dir,
+                        f'auditlogs-{month_start.year}-{month_start.month:02d}.jsonl.gz')
+    temp_path = f'{path}.tmp'
+    table = Auditlog.__table__
+    rows = connection.execution_options(yield_per=5000).execute(
+        select(table)
+        .where(table.c.created_at >= start, table.c.created_at < end)
+        .order_by(table.c.created_at))
+
+    archived = set()
+    count = 0
+    try:
+        with gzip.open(temp_path, 'wt', encoding='utf-8') as archive:
+            if os.path.exists(path):
+                with gzip.open(path, 'rt', encoding='utf-8') as previous:
+                    for line in previous:
+                        archived.add(json.loads(line)['id'])
+                        archive.write(line)
+            for row in rows:
+                if row.id in archived:
+                    continue
+                archive.write(json.dumps(dict(row._mapping), default=str) + '\n')
+                count += 1
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return path, count
+
+
+def drop_month(connection, month_start):
+    """
+    Remove an archived month from the hot audit log, detaching and dropping
+    its partition when the table is partitioned
+    """
+    start, end = month_bounds(month_start)
+    name = partition_name(month_start)
+
+    if is_partitioned(connection) and connection.execute(
+            text("SELECT to_regclass(:name)"), {'name': name}).scalar():
+        connection.execute(text(f'ALTER TABLE auditlogs DETACH PARTITION {name}'))
+        connection.execute(text(f'DROP TABLE {name}'))
+        return
+
+    table = Auditlog.__table__
+    connection.execute(table.delete().where(table.c.created_at >= start,
+                                            table.c.created_at < end))
+
+
+def archive_cold_months(dry_run=False):
+    """
+    Archive and remove every whole month older than the retention window,
+    returning (month start, archive path, rows) for each month
+    """
+    archive_dir = current_app.config['AUDIT_ARCHIVE_DIR']
+    os.makedirs(archive_dir, exist_ok=True)
+
+    archived = []
+    with db.engine.connect() as connection:
+        months = cold_months(connection, retention_cutoff())
+
+    for month_start in months:
+        if dry_run:
+            archived.append((month_start, None, 0))
+            continue
+        with db.engine.begin() as connection:
+            path, count = export_month(connection, month_start, archive_dir)
+            drop_month(connection, month_start)
+        archived.append((month_start, path, count))
+
+    with db.engine.begin() as connection:
+        ensure_partitions(connection)
+
+    return archived
+
+# End of file
@@ -0,0 +1,151 @@
+"""
+Audit log full-text search services.
+
+SQLite keeps an FTS5 table in sync through insert and delete triggers, its
+rows keyed by the INTEGER PRIMARY KEY of auditlogs_search_keys, which maps
+them to the audit log ids and unlike the implicit rowid of auditlogs is
+kept by VACUUM. PostgreSQL keeps a tsvector column, filled by a trigger and
+indexed with GIN. Both index the username, action, resource type and user
+agent of each audit log, and the search falls back to the ILIKE filters
+when neither is installed.
+"""
+
+from sqlalchemy import Float, column, event, func, literal_column, select, table
+from sqlalchemy.orm import with_expression
+from app.extensions import db
+from app.models.auditlog import Auditlog
+from app.models.user import User
+from app.services.fulltext import (install_search_index, search_index_installed,
+                                   search_terms, sqlite_match, tsquery_text)
+
+SQLITE_SEARCH_DDL = [
+    "CREATE TABLE IF NOT EXISTS auditlogs_search_keys ("
+    "search_rowid INTEGER PRIMARY KEY, id VARCHAR(36) NOT NULL UNIQUE)",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS auditlogs_fts USING fts5("
+    "username, action, resource_type, user_agent, prefix='2 3')",
+    "CREATE TRIGGER IF NOT EXISTS auditlogs_fts_insert AFTER INSERT ON auditlogs BEGIN "
+    "INSERT INTO auditlogs_search_keys(id) VALUES (new.id); "
+    "INSERT INTO auditlogs_fts(rowid, username, action, resource_type, user_agent) "
+    "VALUES ((SELECT search_rowid FROM auditlogs_search_keys WHERE id = new.id), "
+    "(SELECT username FROM users WHERE id = new.user_id), "
+    "new.action, new.resource_type, new.user_agent); END",
+    "CREATE TRIGGER IF NOT EXISTS auditlogs_fts_delete AFTER DELETE ON auditlogs BEGIN "
+    "DELETE FROM auditlogs_fts WHERE rowid = "
+    "(SELECT search_rowid FROM auditlogs_search_keys WHERE id = old.id); "
+    "DELETE FROM auditlogs_search_keys WHERE id = old.id; END",
+]
+
+POSTGRESQL_SEARCH_DDL = [
+    "ALTER TABLE auditlogs ADD COLUMN IF NOT EXISTS search_vector tsvector",
+    "CREATE OR REPLACE FUNCTION auditlogs_search_vector() RETURNS trigger AS $$ "
+    "BEGIN NEW.search_vector := to_tsvector('simple', "
+    "coalesce((SELECT username FROM users WHERE id = NEW.user_id), '') || ' ' || "
+    "coalesce(NEW.action, '') || ' ' || coalesce(NEW.resource_type, '') || ' ' || "
+    "coalesce(NEW.user_agent, '')); RETURN NEW; END $$ LANGUAGE plpgsql",
+    "DROP TRIGGER IF EXISTS auditlogs_search_vector ON auditlogs",
+    "CREATE TRIGGER auditlogs_search_vector BEFORE INSERT OR UPDATE ON auditlogs "
+    "FOR EACH ROW EXECUTE FUNCTION auditlogs_search_vector()",
+    "CREATE INDEX IF NOT EXISTS ix_auditlogs_search_vector ON auditlogs "
+    "USING GIN (search_vector)",
+]
+
+SEARCH_DDL = {
+    'sqlite': SQLITE_SEARCH_DDL,
+    'postgresql': POSTGRESQL_SEARCH_DDL
+}
+
+# Index the audit logs written before the search index was installed
+SEARCH_BACKFILL = {
+    'sqlite': [
+        "INSERT OR IGNORE INTO auditlogs_search_keys(id) SELECT id FROM auditlogs",
+        "INSERT INTO auditlogs_fts(rowid, username, action, resource_type, user_agent) "
+        "SELECT k.search_rowid, u.username, a.action, a.resource_type, a.user_agent "
+        "FROM auditlogs a JOIN auditlogs_search_keys k ON k.id = a.id "
+        "LEFT JOIN users u ON u.id = a.user_id",
+    ],
+    # Through the trigger
+    'postgresql': ["UPDATE auditlogs SET search_vector = NULL"],
+}
+
+SEARCH_DROP = {
+    'sqlite': [
+        "DROP TRIGGER IF EXISTS auditlogs_fts_insert",
+        "DROP TRIGGER IF EXISTS auditlogs_fts_delete",
+        "DROP TABLE IF EXISTS auditlogs_fts",
+        "DROP TABLE IF EXISTS auditlogs_search_keys",
+    ],
+    'postgresql': [
+        "DROP INDEX IF EXISTS ix_auditlogs_search_vector",
+        "DROP TRIGGER IF EXISTS auditlogs_search_vector ON auditlogs",
+        "DROP FUNCTION IF EXISTS auditlogs_search_vector()",
+        "ALTER TABLE auditlogs DROP COLUMN IF EXISTS search_vector",
+    ],
+}
+
+_fts_table = table('auditlogs_fts', column('rowid'), column('rank', Float))
+_keys_table = table('auditlogs_search_keys', column('search_rowid'), column('id'))
+
+
+@event.listens_for(Auditlog.__table__, 'after_create')
+def _install_after_create(target, connection, **kw):
+    """
+    Install the search index whenever db.create_all() creates the auditlogs table
+    """
+    install_search_index(connection, SEARCH_DDL)
+
+
+def _ranked_matches(dialect, terms, criteria):
+    """
+    Build the subquery of the ids and search_rank of the audit logs matching
+    every term prefix and the listing criteria, a higher rank being a better
+    match
+    """
+    if dialect == 'sqlite':
+        # FTS5 ranks the best matches lowest
+        return select(Auditlog.id, (-_fts_table.c.rank).label('search_rank')) \
+            .select_from(_fts_table) \
+            .join(_keys_table, _keys_table.c.search_rowid == _fts_table.c.rowid) \
+            .join(Auditlog, Auditlog.id == _keys_table.c.id) \
+            .where(literal_column('auditlogs_fts').op('MATCH')(sqlite_match(terms)),
+                   *criteria) \
+            .subquery()
+
+    vector = literal_column('auditlogs.search_vector')
+    tsquery = func.to_tsquery('simple', tsquery_text(terms))
+    return select(Auditlog.id, func.ts_rank(vector, tsquery, type_=Float).label('search_rank')) \
+        .where(vector.op('@@')(tsquery), *criteria) \
+        .subquery()
+
+
+def _ilike_filter(search):
+    """
+    Build the unindexed ILIKE predicate used when full-text search is unavailable
+    """
+    return (
+        User.username.ilike(f'%{search}%') |
+        Auditlog.action.ilike(f'%{search}%') |
+        Auditlog.resource_type.ilike(f'%{search}%') |
+        Auditlog.user_agent.ilike(f'%{search}%')
+    )
+
+
+def search_audit_logs(query, search, *criteria):
+    """
+    Filter an audit log query to the entries matching the search string,
+    returning the query and the rank column to order it by. The listing
+    criteria, such as its retention window, are applied in the ranking
+    subquery so it only ranks the listed entries, and the rank of each entry
+    is loaded into Auditlog.search_rank for the pagination cursor. The ILIKE
+    fallback has no rank column
+    """
+    terms = search_terms(search)
+    if terms and search_index_installed('auditlogs_fts', 'auditlogs'):
+        matches = _ranked_matches(db.engine.dialect.name, terms, criteria)
+        query = query.join(matches, matches.c.id == Auditlog.id) \
+            .options(with_expression(Auditlog.search_rank, matches.c.search_rank))
+        return query, matches.c.search_rank
+
+    query = query.outerjoin(User, User.id == Auditlog.user_id).filter(_ilike_filter(search))
+    return query, None
+
+# End of file
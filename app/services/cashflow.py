@@ -0,0 +1,165 @@
+"""
+Cash-flow time series of a user's transactions for the dashboard charts.
+
+The transactions are summed per day, week, month, quarter or year in SQL,
+with date_trunc on PostgreSQL and the date and strftime functions on SQLite,
+so only one row per bucket leaves the database. A range that would give
+more than CASHFLOW_MAX_POINTS buckets is downsampled to the next coarser
+bucket, which keeps the sums exact, and one giving more even in years is
+rejected. The empty buckets are filled in with zeros so the series line up
+with their labels.
+
+The series version is the latest change of the user's transactions, their
+count and the latest rates load, read from indexes and small tables so a
+request whose ETag is still current is answered without summing anything.
+"""
+
+import hashlib
+from datetime import timedelta
+from sqlalchemy import Date, Integer, and_, case, cast, func, literal_column, select, type_coerce
+from app.extensions import db
+from app.models.summary import MonthlySummary
+from app.models.transaction import Transaction, TType
+from app.services.exchange import converted_amount, rate_join, rates_version
+from app.utils.periods import in_range, period_range
+
+BUCKETS = ('day', 'week', 'month', 'quarter', 'year')
+
+
+def bucket_range(value, bucket):
+    """
+    Return the half-open range of the bucket containing a date
+    """
+    if bucket == 'day':
+        return value, value + timedelta(days=1)
+    return period_range(bucket, value)
+
+
+def bucket_starts(start, end, bucket):
+    """
+    Return the start dates of the buckets overlapping a half-open range
+    """
+    starts = []
+    current = bucket_range(start, bucket)[0]
+    while current < end:
+        starts.append(current)
+        try:
+            current = bucket_range(current, bucket)[1]
+        except (OverflowError, ValueError):
+            # The bucket holds the last date there is
+            break
+    return starts
+
+
+def bucket_count(start, end, bucket):
+    """
+    Return the number of buckets overlapping a non-empty half-open range,
+    counted without listing them
+    """
+    last = end - timedelta(days=1)
+    if bucket == 'day':
+        return (end - start).days
+    if bucket == 'week':
+        weeks = (last - timedelta(days=last.weekday())) - (start - timedelta(days=start.weekday()))
+        return weeks.days // 7 + 1
+    months = {'month': 1, 'quarter': 3, 'year': 12}[bucket]
+    return ((last.year * 12 + last.month - 1) // months
+            - (start.year * 12 + start.month - 1) // months + 1)
+
+
+def choose_bucket(start, end, bucket, max_points):
+    """
+    Return the requested bucket, or the first coarser one giving at most
+    max_points buckets over the range, raising ValueError when even the
+    year buckets give more
+    """
+    for candidate in BUCKETS[BUCKETS.index(bucket):]:
+        if bucket_count(start, end, candidate) <= max_points:
+            return candidate
+    raise ValueError(f'The range is too long, it cannot span more than {max_points} years')
+
+
+def _bucket_expression(dialect, bucket):
+    """
+    Build the expression of the start date of the bucket of a transaction
+    """
+    if dialect == 'postgresql':
+        # The field is inlined so the GROUP BY matches the selected expression,
+        # bound parameters would differ. It is one of the BUCKETS names
+        return cast(func.date_trunc(literal_column(f"'{bucket}'"), Transaction.date), Date)
+
+    # SQLite dates are ISO text, the results are parsed back by the Date type
+    date = Transaction.date
+    expressions = {
+        'day': date,
+        'week': func.date(date, 'weekday 0', '-6 days'),
+        'month': func.strftime('%Y-%m-01', date),
+        'quarter': func.printf('%s-%02d-01', func.strftime('%Y', date),
+                               (cast(func.strftime('%m', date), Integer) - 1) // 3 * 3 + 1),
+        'year': func.strftime('%Y-01-01', date),
+    }
+    return type_coerce(expressions[bucket], Date)
+
+
+def cashflow_version(user_id):
+    """
+    Return an opaque version of the cash-flow series of a user, changed by
+    every insert, update or delete of their transactions and rates load,
+    a corrected reload of existing rates included
+    """
+    row = db.session.execute(select(
+        select(func.max(Transaction.updated_at))
+        .where(Transaction.user_id == user_id).scalar_subquery(),
+        select(func.coalesce(func.sum(MonthlySummary.count), 0))
+        .where(MonthlySummary.user_id == user_id).scalar_subquery(),
+    )).one()
+    return '|'.join(str(value) for value in (*row, rates_version()))
+
+
+def cashflow_etag(user_id, currency, start, end, bucket):
+    """
+    Return the ETag of a cash-flow series request
+    """
+    key = f'{user_id}|{currency}|{start}|{end}|{bucket}|{cashflow_version(user_id)}'
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def cashflow_series(user_id, start, end, bucket, currency):
+    """
+    Return the income, expenses and net of a user per bucket over the
+    half-open [start, end) range in a currency, as JSON serializable lists
+    along the bucket start labels. Transactions without a rate for their
+    date are left out and counted as unconverted
+    """
+    amount, rate = converted_amount(currency)
+    period = _bucket_expression(db.engine.dialect.name, bucket).label('period')
+    statement = select(
+        period,
+        func.coalesce(func.sum(case(
+            (Transaction.transaction_type == TType.INCOME, amount), else_=0)), 0).label('income'),
+        func.coalesce(func.sum(case(
+            (Transaction.transaction_type == TType.EXPENSE, amount), else_=0)), 0).label('expenses'),
+        func.count(case(
+            (and_(Transaction.currency != currency, rate.rate.is_(None)), 1))).label('unconverted'),
+    ).select_from(Transaction) \
+        .outerjoin(rate, rate_join(rate, currency)) \
+        .where(Transaction.user_id == user_id, in_range(Transaction.date, start, end)) \
+        .group_by(period)
+
+    totals = {row.period: row for row in db.session.execute(statement)}
+    labels = bucket_starts(start, end, bucket)
+    income = [float(totals[label].income) if label in totals else 0.0 for label in labels]
+    expenses = [float(totals[label].expenses) if label in totals else 0.0 for label in labels]
+    return {
+        'from': start.isoformat(),
+        'to': (end - timedelta(days=1)).isoformat(),
+        'bucket': bucket,
+        'currency': currency,
+        'labels': [label.isoformat() for label in labels],
+        'income': income,
+        'expenses': expenses,
+        'net': [round(value - cost, 2) for value, cost in zip(income, expenses)],
+        'unconverted': sum(row.unconverted for row in totals.values()),
+    }
+
+# End of file
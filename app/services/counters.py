@@ -0,0 +1,191 @@
+"""
+Row count services used by the listing views instead of a COUNT(*) per request
+"""
+
+import time
+import threading
+import sqlalchemy.exc
+from flask import current_app
+from sqlalchemy import event, func, literal_column, select, text
+from app.extensions import db
+from app.models.rowcount import RowCount
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def adjust_row_count(connection, table_name, delta):
+    """
+    Add a delta to the exact counter of a table, used by the mapper events
+    and by Core bulk statements that bypass them
+    """
+    if not delta:
+        return
+    table = RowCount.__table__
+    connection.execute(table.update()
+                       .where(table.c.table_name == table_name)
+                       .values(count=table.c.count + delta))
+
+
+def init_row_counters(app):
+    """
+    A function to register the insert and delete listeners of the tables
+    counted with the exact strategy
+    """
+    tables = {name for name, strategy in app.config['ROW_COUNT_STRATEGIES'].items()
+              if strategy == 'exact'}
+
+    for mapper in db.Model.registry.mappers:
+        table_name = mapper.local_table.name
+        if table_name not in tables or event.contains(mapper, 'after_insert', _count_insert):
+            continue
+        event.listen(mapper, 'after_insert', _count_insert)
+        event.listen(mapper, 'after_delete', _count_delete)
+
+
+def _count_insert(mapper, connection, target):
+    """
+    Increment the exact counter of an inserted row table
+    """
+    adjust_row_count(connection, mapper.local_table.name, 1)
+
+
+def _count_delete(mapper, connection, target):
+    """
+    Decrement the exact counter of a deleted row table
+    """
+    adjust_row_count(connection, mapper.local_table.name, -1)
+
+
+def _cached(key, ttl, loader):
+    """
+    Return a cached value, calling the loader when missing or expired
+    """
+    now = time.monotonic()
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry and entry[1] > now:
+            return entry[0]
+
+    value = loader()
+    with _cache_lock:
+        _cache[key] = (value, now + ttl)
+    return value
+
+
+def _table_count(table, *criteria):
+    """
+    Run a full COUNT(*) of a table, or of its rows matching the criteria
+    """
+    return db.session.execute(
+        select(func.count()).select_from(table).where(*criteria)).scalar() or 0
+
+
+def exact_count(table):
+    """
+    Return the exact counter of a table, seeding it with a COUNT(*) on the
+    first read
+    """
+    stored = db.session.get(RowCount, table.name)
+    if stored is not None:
+        return stored.count
+
+    count = _table_count(table)
+    try:
+        db.session.add(RowCount(table_name=table.name, count=count))
+        db.session.commit()
+    except sqlalchemy.exc.IntegrityError:
+        # Another request seeded the counter first
+        db.session.rollback()
+    return count
+
+
+def cached_count(table, ttl, *criteria, key=None):
+    """
+    Return a COUNT(*) of a table, or of its rows matching the criteria named
+    by key, cached for ttl seconds
+    """
+    return _cached(('count', table.name, key), ttl, lambda: _table_count(table, *criteria))
+
+
+def _filtered_estimate(connection, table, criteria):
+    """
+    Read the planner row estimate of the rows of a table matching criteria,
+    None when the database does not give one
+    """
+    if connection.dialect.name != 'postgresql':
+        # SQLite has no row estimates of a filtered scan
+        return None
+    statement = select(literal_column('1')).select_from(table).where(*criteria)
+    compiled = statement.compile(dialect=connection.dialect)
+    plan = connection.exec_driver_sql(f'EXPLAIN (FORMAT JSON) {compiled}',
+                                      compiled.params).scalar()
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def _planner_estimate(table, *criteria):
+    """
+    Read the planner row estimate of a table, or of its rows matching the
+    criteria, None when it is not available
+    """
+    dialect = db.engine.dialect.name
+    queries = {
+        'postgresql': "SELECT reltuples::bigint FROM pg_class "
+                      "WHERE oid = to_regclass(:table_name)",
+        'sqlite': "SELECT stat FROM sqlite_stat1 WHERE tbl = :table_name",
+        'mysql': "SELECT table_rows FROM information_schema.tables "
+                 "WHERE table_schema = DATABASE() AND table_name = :table_name"
+    }
+    if dialect not in queries:
+        return None
+
+    try:
+        with db.engine.connect() as connection:
+            if criteria:
+                return _filtered_estimate(connection, table, criteria)
+            value = connection.execute(text(queries[dialect]),
+                                       {'table_name': table.name}).scalar()
+    except sqlalchemy.exc.DBAPIError:
+        # sqlite_stat1 only exists once ANALYZE has run
+        return None
+
+    if value is None:
+        return None
+    if dialect == 'sqlite':
+        # The first number of a sqlite_stat1 entry is the table row count
+        value = value.split()[0]
+    value = int(value)
+    # PostgreSQL reports -1 for a table that was never analyzed
+    return value if value >= 0 else None
+
+
+def estimated_count(table, ttl, *criteria, key=None):
+    """
+    Return the planner row estimate of a table, or of its rows matching the
+    criteria named by key, cached for ttl seconds, falling back to a cached
+    COUNT(*) when the database has no estimate
+    """
+    def load():
+        estimate = _planner_estimate(table, *criteria)
+        return estimate if estimate is not None else _table_count(table, *criteria)
+
+    return _cached(('estimate', table.name, key), ttl, load)
+
+
+def row_count(model, *criteria, key=None):
+    """
+    Return the row count of a model table using its configured strategy, or
+    of its rows matching the criteria named by key. The exact counters only
+    count whole tables, filtered counts of their tables are cached COUNT(*)
+    """
+    table = model.__table__
+    strategy = current_app.config['ROW_COUNT_STRATEGIES'].get(table.name, 'cached')
+    ttl = current_app.config['ROW_COUNT_CACHE_SECONDS']
+
+    if strategy == 'exact' and not criteria:
+        return exact_count(table)
+    if strategy == 'estimate':
+        return estimated_count(table, ttl, *criteria, key=key)
+    return cached_count(table, ttl, *criteria, key=key)
+
+# End of file
@@ -0,0 +1,212 @@
+"""
+Exchange rate services for the multi-currency totals.
+
+Rates are loaded from CSV files of (date, pair, rate) rows into the
+exchange_rates table. The load fills the days between the loaded dates, up
+to today, with the previous rate and adds the inverse of every pair, so an
+amount in any loaded currency is converted with an equality join on
+(base, quote, date) in SQL. The Python side reads single rates through a
+per-process cache keyed by (date, pair). Every row written by a load is
+stamped with its loaded_at time, later than any previous load, so the latest
+loaded_at is the version of the rates. Each process reads it at most every
+EXCHANGE_RATE_VERSION_SECONDS, and once per request, and the cached rates of
+an older version are dropped, in every process.
+"""
+
+import csv
+import time
+import threading
+from datetime import date, datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from flask import current_app, g, has_request_context
+from sqlalchemy import and_, case, delete, func, select, type_coerce
+from sqlalchemy.orm import aliased
+from app.extensions import db
+from app.models.exchange_rate import ExchangeRate
+from app.models.transaction import Transaction
+from app.utils.money import Money, MoneyType
+
+RATE_PLACES = Decimal('0.0000000001')
+
+_cache = {}
+_version = None
+# The latest version read by the process and when it is read again
+_latest = None
+_lock = threading.Lock()
+
+
+def parse_pair(text):
+    """
+    Split a currency pair written USD/KES, USD-KES or USDKES into its base
+    and quote currencies
+    """
+    letters = ''.join(ch for ch in text.upper() if ch.isalpha())
+    if len(letters) != 6:
+        raise ValueError(f'invalid currency pair {text!r}')
+    return letters[:3], letters[3:]
+
+
+def read_rates_csv(stream):
+    """
+    Return the {(base, quote): {date: rate}} of a CSV file with date, pair
+    and rate columns
+    """
+    rates = {}
+    for line_number, row in enumerate(csv.DictReader(stream), 2):
+        row = {key.strip().lower(): (value or '').strip() for key, value in row.items() if key}
+        try:
+            pair = parse_pair(row['pair'])
+            day = date.fromisoformat(row['date'])
+            rate = Decimal(row['rate'])
+        except (KeyError, ValueError, InvalidOperation) as exc:
+            raise ValueError(f'line {line_number}: {exc}') from exc
+        if not rate.is_finite() or rate <= 0:
+            raise ValueError(f'line {line_number}: invalid rate {row["rate"]!r}')
+        rates.setdefault(pair, {})[day] = rate
+    return rates
+
+
+def _daily_rates(by_date, until):
+    """
+    Yield a (date, rate) for every day from the first loaded date to until,
+    days without a rate taking the previous one
+    """
+    days = sorted(by_date)
+    day, rate = days[0], by_date[days[0]]
+    last = max(days[-1], until)
+    while day <= last:
+        rate = by_date.get(day, rate)
+        yield day, rate
+        day += timedelta(days=1)
+
+
+def load_rates(rates, until=None):
+    """
+    Replace the stored rates of the loaded pairs over the loaded dates with
+    the daily filled rates and their inverses, returning the rows written
+    """
+    until = until or date.today()
+    pairs = {pair: dict(by_date) for pair, by_date in rates.items()}
+    for (base, quote), by_date in rates.items():
+        # Rates given for a pair win over the inverse of its opposite pair
+        inverse = pairs.setdefault((quote, base), {})
+        for day, rate in by_date.items():
+            inverse.setdefault(day, (1 / rate).quantize(RATE_PLACES))
+
+    table = ExchangeRate.__table__
+    # Later than the previous load even when the clocks of the hosts differ
+    latest = db.session.execute(select(func.max(table.c.loaded_at))).scalar()
+    loaded_at = datetime.now()
+    if latest is not None and loaded_at <= latest:
+        loaded_at = latest + timedelta(microseconds=1)
+
+    written = 0
+    for (base, quote), by_date in pairs.items():
+        rows = [{'base': base, 'quote': quote, 'date': day, 'rate': rate,
+                 'loaded_at': loaded_at}
+                for day, rate in _daily_rates(by_date, until)]
+        db.session.execute(delete(table).where(
+            table.c.base == base, table.c.quote == quote,
+            table.c.date.between(rows[0]['date'], rows[-1]['date'])))
+        db.session.execute(table.insert(), rows)
+        written += len(rows)
+    db.session.commit()
+    invalidate_rates()
+    return written
+
+
+def invalidate_rates():
+    """
+    Discard the cached rates and version of the current process
+    """
+    global _version, _latest
+    with _lock:
+        _version = None
+        _latest = None
+        _cache.clear()
+
+
+def rates_version():
+    """
+    Return the version of the loaded rates, the time of the latest load, read
+    at most every EXCHANGE_RATE_VERSION_SECONDS and kept for the request
+    """
+    global _latest
+    if has_request_context() and 'rates_version' in g:
+        return g.rates_version
+    now = time.monotonic()
+    with _lock:
+        latest = _latest
+    if latest is not None and latest[1] > now:
+        version = latest[0]
+    else:
+        version = db.session.execute(select(func.max(ExchangeRate.loaded_at))).scalar()
+        ttl = current_app.config['EXCHANGE_RATE_VERSION_SECONDS']
+        with _lock:
+            _latest = (version, now + ttl)
+    if has_request_context():
+        g.rates_version = version
+    return version
+
+
+def exchange_rate(on_date, base, quote):
+    """
+    Return the Decimal rate of a pair on a day, None when it is not loaded
+    """
+    if base == quote:
+        return Decimal(1)
+
+    global _version
+    key = (on_date, f'{base}/{quote}')
+    version = rates_version()
+    now = time.monotonic()
+    with _lock:
+        if _version != version:
+            # Rates loaded since, possibly by another process
+            _version = version
+            _cache.clear()
+        entry = _cache.get(key)
+    if entry and entry[0] == version and entry[1] > now:
+        return entry[2]
+
+    rate = db.session.execute(select(ExchangeRate.rate).where(
+        ExchangeRate.base == base, ExchangeRate.quote == quote,
+        ExchangeRate.date == on_date)).scalar()
+    with _lock:
+        ttl = current_app.config['EXCHANGE_RATE_CACHE_SECONDS']
+        _cache[key] = (version, now + ttl, rate)
+    return rate
+
+
+def convert(amount, currency, to_currency, on_date):
+    """
+    Return a Money amount converted to another currency at the rate of a
+    day, rounded half up to the cent, None when the rate is not loaded
+    """
+    rate = exchange_rate(on_date, currency, to_currency)
+    if rate is None:
+        return None
+    return Money.parse(amount.amount * rate)
+
+
+def converted_amount(currency):
+    """
+    Return the transaction amount converted to a currency, NULL when its rate
+    is not loaded, and the rate alias to outer join with rate_join
+    """
+    rate = aliased(ExchangeRate)
+    amount = case(
+        (Transaction.currency == currency, Transaction.amount),
+        else_=type_coerce(func.round(Transaction.amount * rate.rate), MoneyType))
+    return amount, rate
+
+
+def rate_join(rate, currency):
+    """
+    Build the join condition of the rate alias of converted_amount
+    """
+    return and_(rate.base == Transaction.currency,
+                rate.quote == currency,
+                rate.date == Transaction.date)
+
+# End of file
@@ -0,0 +1,80 @@
+"""
+Full-text search helpers shared by the listing search services.
+
+Each searchable table declares the DDL of its index per dialect: an FTS5
+table keyed by rowid on SQLite, a trigger-maintained tsvector column with a
+GIN index on PostgreSQL.
+"""
+
+import re
+import sqlalchemy.exc
+from sqlalchemy import text
+from app.extensions import db
+
+# Per (database URL, index name) flag of whether a search index is installed
+_available = {}
+
+
+def install_search_index(connection, statements):
+    """
+    Run the search index DDL of the connection dialect, returning False when
+    the database does not support it
+    """
+    statements = statements.get(connection.dialect.name)
+    if statements is None:
+        return False
+
+    try:
+        with connection.begin_nested():
+            for statement in statements:
+                connection.exec_driver_sql(statement)
+    except sqlalchemy.exc.OperationalError:
+        # SQLite compiled without FTS5
+        return False
+    return True
+
+
+def search_index_installed(fts_table, table_name):
+    """
+    Check if a search index is installed on the current database, the FTS5
+    table on SQLite or the search_vector column of table_name on PostgreSQL
+    """
+    key = (str(db.engine.url), fts_table)
+    if key not in _available:
+        with db.engine.connect() as connection:
+            if connection.dialect.name == 'sqlite':
+                found = connection.execute(text(
+                    "SELECT 1 FROM sqlite_master WHERE name = :name"),
+                    {'name': fts_table}).scalar()
+            elif connection.dialect.name == 'postgresql':
+                found = connection.execute(text(
+                    "SELECT 1 FROM information_schema.columns WHERE "
+                    "table_name = :name AND column_name = 'search_vector'"),
+                    {'name': table_name}).scalar()
+            else:
+                found = None
+        _available[key] = bool(found)
+    return _available[key]
+
+
+def search_terms(search):
+    """
+    Split a search string into the word tokens used for prefix matching
+    """
+    return re.findall(r'\w+', search.lower())
+
+
+def sqlite_match(terms):
+    """
+    Build an FTS5 MATCH expression requiring a prefix match of every term
+    """
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def tsquery_text(terms):
+    """
+    Build a to_tsquery expression requiring a prefix match of every term
+    """
+    return ' & '.join(f'{term}:*' for term in terms)
+
+# End of file
@@ -0,0 +1,193 @@
+"""
+Identity cache of the authenticated user read by the login manager user loader.
+
+A user is cached with its role, as a detached copy merged into the request
+session without a query, under a key made of the user id, its session
+version and the version of the roles. The user views bump the session
+version on password, role, status and profile changes, and the role views
+bump the roles version when a role is renamed or deleted, so the next
+request reloads the user. Entries are kept in an in-process LRU for
+IDENTITY_CACHE_SECONDS, its versions in the cache_versions table, or in a
+Redis compatible server when IDENTITY_CACHE_URL is set. Either way the
+processes share the versions.
+"""
+
+import time
+import pickle
+import threading
+from collections import OrderedDict
+from sqlalchemy import inspect, select
+from sqlalchemy.orm import joinedload, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+from app.extensions import db
+from app.models.user import User
+from app.services.versions import bump_cache_version, cache_versions
+
+# Backend key of the version of all the roles
+ROLES_VERSION_KEY = 'identity:version:roles'
+
+
+class MemoryIdentityBackend:
+    """
+    In-process LRU of identity entries with a TTL, the version counters are
+    kept in the cache_versions table so they are shared by the processes and
+    never evicted
+    """
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Return a live entry, None when missing or expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value, ttl):
+        """
+        Store an entry for ttl seconds, evicting the least recently used
+        """
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def counters(self, keys):
+        """
+        Return the current values of counters, read once per request
+        """
+        return cache_versions(keys)
+
+    def incr(self, key):
+        """
+        Increment a counter
+        """
+        bump_cache_version(key)
+
+
+class RedisIdentityBackend:
+    """
+    Identity entries kept in a Redis compatible server shared by the processes
+    """
+    def __init__(self, url):
+        # Optional dependency, only needed when IDENTITY_CACHE_URL is set
+        import redis
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        """
+        Return a live entry, None when missing or expired
+        """
+        value = self.client.get(key)
+        return pickle.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl):
+        """
+        Store an entry for ttl seconds
+        """
+        self.client.set(key, pickle.dumps(value), ex=ttl)
+
+    def counters(self, keys):
+        """
+        Return the current values of counters
+        """
+        return [int(value or 0) for value in self.client.mget(keys)]
+
+    def incr(self, key):
+        """
+        Increment a counter
+        """
+        self.client.incr(key)
+
+
+def _detached_copy(instance):
+    """
+    Copy the loaded columns of an instance into a detached instance that can
+    be merged with load=False
+    """
+    mapper = inspect(instance).mapper
+    copy = mapper.class_manager.new_instance()
+    for attr in mapper.column_attrs:
+        set_committed_value(copy, attr.key, getattr(instance, attr.key))
+    make_transient_to_detached(copy)
+    return copy
+
+
+class IdentityCache:
+    """
+    Cache of the authenticated users keyed by user id and session version
+    """
+    def __init__(self, app=None):
+        self.backend = None
+        self.ttl = 30
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        A function to configure the cache backend from the app config
+        """
+        self.ttl = app.config['IDENTITY_CACHE_SECONDS']
+        url = app.config['IDENTITY_CACHE_URL']
+        self.backend = RedisIdentityBackend(url) if url \
+            else MemoryIdentityBackend(app.config['IDENTITY_CACHE_SIZE'])
+
+    @staticmethod
+    def _version_key(user_id):
+        """
+        Return the backend key of the session version of a user
+        """
+        return f'identity:version:{user_id}'
+
+    def load(self, user_id):
+        """
+        Return the user attached to the current session with its role loaded,
+        reading the database only on a cache miss
+        """
+        version, roles_version = self.backend.counters([self._version_key(user_id),
+                                                        ROLES_VERSION_KEY])
+        key = f'identity:{user_id}:{version}:{roles_version}'
+
+        cached = self.backend.get(key)
+        if cached is not None:
+            return db.session.merge(cached, load=False)
+
+        user = db.session.execute(
+            select(User).options(joinedload(User.role)).where(User.id == user_id)
+        ).scalar_one_or_none()
+        if user is None:
+            return None
+
+        copy = _detached_copy(user)
+        role = _detached_copy(user.role) if user.role is not None else None
+        set_committed_value(copy, 'role', role)
+        self.backend.set(key, copy, self.ttl)
+        return user
+
+    def bump(self, user_id):
+        """
+        Bump the session version of a user so its cached identity is reloaded
+        """
+        self.backend.incr(self._version_key(user_id))
+
+    def bump_roles(self):
+        """
+        Bump the version of the roles so every cached identity is reloaded
+        with its current role
+        """
+        self.backend.incr(ROLES_VERSION_KEY)
+
+
+identity_cache = IdentityCache()
+
+# End of file
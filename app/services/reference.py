@@ -0,0 +1,95 @@
+"""
+Reference data cache of the category and role lookup lists behind the form
+choices.
+
+Each list is kept per process for REFERENCE_CACHE_SECONDS and stamped with
+its version in the cache_versions table, which the category and role views
+bump after every write, so every process reloads the list on its next read.
+A request keeps the first list it reads.
+"""
+
+import time
+import threading
+from flask import current_app, g
+from sqlalchemy import select
+from app.extensions import db
+from app.models.category import Category
+from app.models.role import Role
+from app.services.versions import bump_cache_version, cache_version
+
+REFERENCE_MODELS = {
+    'categories': Category,
+    'roles': Role
+}
+
+_cache = {}
+_lock = threading.Lock()
+
+
+def invalidate_reference(name):
+    """
+    Bump the version of a reference list, discarding its cached copies
+    """
+    bump_cache_version(f'reference:{name}')
+    with _lock:
+        _cache.pop(name, None)
+
+
+def _load(name):
+    """
+    Read the (id, name) pairs of a reference table
+    """
+    model = REFERENCE_MODELS[name]
+    rows = db.session.execute(select(model.id, model.name)).all()
+    return [(row.id, row.name) for row in rows]
+
+
+def reference_list(name):
+    """
+    Return the (id, name) pairs of a reference table from the request, the
+    process cache or the database
+    """
+    request_cache = g.setdefault('reference_lists', {})
+    if name in request_cache:
+        return request_cache[name]
+
+    # Read before the list, a write during the load leaves it stamped with
+    # the older version and reloaded by the next request
+    version = cache_version(f'reference:{name}')
+    now = time.monotonic()
+    with _lock:
+        entry = _cache.get(name)
+
+    if entry and entry[0] == version and entry[1] > now:
+        items = entry[2]
+    else:
+        items = _load(name)
+        with _lock:
+            ttl = current_app.config['REFERENCE_CACHE_SECONDS']
+            _cache[name] = (version, now + ttl, items)
+
+    request_cache[name] = items
+    return items
+
+
+def category_choices():
+    """
+    Return the (id, name) choices of the category select fields
+    """
+    return list(reference_list('categories'))
+
+
+def role_choices():
+    """
+    Return the (id, name) choices of the role select fields
+    """
+    return list(reference_list('roles'))
+
+
+def currency_choices():
+    """
+    Return the (code, code) choices of the currency select fields
+    """
+    return [(code, code) for code in current_app.config['CURRENCIES']]
+
+# End of file
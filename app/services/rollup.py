@@ -0,0 +1,91 @@
+"""
+Monthly rollup services for reading and rebuilding the monthly summaries
+"""
+
+from sqlalchemy import and_, case, extract, func, or_, select
+from app.extensions import db
+from app.models.summary import MonthlySummary
+from app.models.transaction import Transaction, TType
+
+
+def is_whole_months(start, end):
+    """
+    Check if a half-open [start, end) date range covers whole months only
+    """
+    return start.day == 1 and end.day == 1 and start < end
+
+
+def month_filter(start, end):
+    """
+    Build a predicate selecting the summary months of a whole month range
+    """
+    predicates = []
+    for year in range(start.year, end.year + 1):
+        first = start.month if year == start.year else 1
+        # The end of the range is exclusive, so January of the end year is none
+        last = end.month - 1 if year == end.year else 12
+        if first > last:
+            continue
+        predicates.append(and_(MonthlySummary.year == year,
+                               MonthlySummary.month.between(first, last)))
+    return or_(*predicates)
+
+
+def summarize_months(user_id, start, end):
+    """
+    Return the income, expenses and count of a user per currency for a whole
+    month range, read from the monthly summaries instead of the transactions
+    """
+    income = func.coalesce(func.sum(case(
+        (MonthlySummary.transaction_type == TType.INCOME, MonthlySummary.total),
+        else_=0)), 0)
+    expenses = func.coalesce(func.sum(case(
+        (MonthlySummary.transaction_type == TType.EXPENSE, MonthlySummary.total),
+        else_=0)), 0)
+
+    return db.session.execute(select(
+        MonthlySummary.currency,
+        income.label('income'),
+        expenses.label('expenses'),
+        func.coalesce(func.sum(MonthlySummary.count), 0).label('count')
+    ).where(
+        MonthlySummary.user_id == user_id,
+        month_filter(start, end)
+    ).group_by(MonthlySummary.currency)).all()
+
+
+def rebuild_rollups(user_id=None):
+    """
+    Rebuild the monthly summaries from the transactions table, for one user
+    or for everybody, and return the number of summary rows written
+    """
+    year = extract('year', Transaction.date)
+    month = extract('month', Transaction.date)
+    source = select(
+        Transaction.user_id,
+        year.label('year'),
+        month.label('month'),
+        Transaction.category_id,
+        Transaction.transaction_type,
+        Transaction.currency,
+        func.sum(Transaction.amount),
+        func.count()
+    ).group_by(Transaction.user_id, year, month, Transaction.category_id,
+               Transaction.transaction_type, Transaction.currency)
+
+    delete = MonthlySummary.__table__.delete()
+    if user_id:
+        source = source.where(Transaction.user_id == user_id)
+        delete = delete.where(MonthlySummary.user_id == user_id)
+
+    table = MonthlySummary.__table__
+    db.session.execute(delete)
+    result = db.session.execute(table.insert().from_select(
+        ['user_id', 'year', 'month', 'category_id', 'transaction_type', 'currency',
+         'total', 'count'],
+        source))
+    db.session.commit()
+
+    return result.rowcount
+
+# End of file
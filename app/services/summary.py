@@ -0,0 +1,76 @@
+"""
+Transaction summary services for period totals
+"""
+
+from sqlalchemy import and_, case, func, select
+from app.extensions import db
+from app.models.transaction import Transaction, TType
+from app.services.exchange import converted_amount, rate_join
+from app.services.rollup import is_whole_months, summarize_months
+from app.utils.money import Money
+from app.utils.periods import in_range
+
+
+def period_summary_statement(user_id, start, end, currency=None):
+    """
+    Build the single pass income, expenses and count aggregate of a user for
+    the half-open [start, end) date range. With a currency the amounts are
+    converted to it through a join on the exchange rates of their dates, the
+    transactions without a rate are counted as unconverted
+    """
+    amount = Transaction.amount
+    if currency is not None:
+        amount, rate = converted_amount(currency)
+
+    income = func.coalesce(func.sum(case(
+        (Transaction.transaction_type == TType.INCOME, amount),
+        else_=0)), 0)
+    expenses = func.coalesce(func.sum(case(
+        (Transaction.transaction_type == TType.EXPENSE, amount),
+        else_=0)), 0)
+
+    columns = [income.label('income'), expenses.label('expenses'), func.count().label('count')]
+    if currency is not None:
+        columns.append(func.count(case(
+            (and_(Transaction.currency != currency, rate.rate.is_(None)), 1))).label('unconverted'))
+
+    statement = select(*columns).where(
+        Transaction.user_id == user_id,
+        in_range(Transaction.date, start, end)
+    )
+    if currency is not None:
+        statement = statement.select_from(Transaction).outerjoin(rate, rate_join(rate, currency))
+    return statement
+
+
+def summarize_period(user_id, start, end, currency):
+    """
+    Return the income, expenses, balance and transaction count of a user for
+    the half-open [start, end) date range in a currency. Whole month ranges
+    are read from the monthly summaries when they hold that currency only,
+    other currencies are converted at the rate of each transaction date
+    """
+    row = None
+    if is_whole_months(start, end):
+        totals = summarize_months(user_id, start, end)
+        if all(total.currency == currency for total in totals):
+            row = {'income': sum(total.income for total in totals),
+                   'expenses': sum(total.expenses for total in totals),
+                   'count': sum(total.count for total in totals),
+                   'unconverted': 0}
+    if row is None:
+        row = db.session.execute(
+            period_summary_statement(user_id, start, end, currency)).one()._asdict()
+
+    income = row['income'] or Money(0)
+    expenses = row['expenses'] or Money(0)
+    return {
+        'income': income,
+        'expenses': expenses,
+        'balance': income - expenses,
+        'count': row['count'],
+        'unconverted': row['unconverted'],
+        'currency': currency
+    }
+
+# End of file
@@ -0,0 +1,316 @@
+"""
+Bulk import of transactions from bank CSV and OFX files.
+
+The file is parsed as a stream and validated in chunks of IMPORT_CHUNK_SIZE
+rows, with the categories mapped by name from a lookup loaded once. Each
+chunk of valid rows is inserted with one executemany INSERT in its own
+transaction, along with the monthly summary deltas the skipped mapper events
+would have applied. The search index triggers fire in the database as usual.
+Rejected rows are written to a CSV error file with their line number and
+the reason they were rejected. A file that cannot be decoded or parsed as
+CSV stops the import there: the chunks before stay committed and the report
+tells the last line imported, so the rest of the file can be imported once
+fixed.
+
+On SQLite the commits are dominated by the journal fsyncs, so the import
+connection runs with the IMPORT_SQLITE_PRAGMAS, restored when it is done.
+The journal mode is not switched here, SQLITE_JOURNAL_MODE sets it for the
+whole app.
+"""
+
+import csv
+import re
+import time
+from contextlib import contextmanager
+from datetime import date, datetime
+from itertools import islice
+from flask import current_app
+from sqlalchemy import select
+from app.extensions import db
+from app.models.category import Category
+from app.models.shared import generate_uuid
+from app.models.summary import apply_rollup_deltas, rollup_key
+from app.models.transaction import Transaction, TType
+from app.services.counters import adjust_row_count
+from app.utils.money import Money
+
+IMPORT_FORMATS = ('csv', 'ofx')
+
+# CSV header names accepted for each transaction field
+CSV_COLUMNS = {
+    'date': ('date', 'posted', 'transaction date'),
+    'amount': ('amount', 'value'),
+    'description': ('description', 'memo', 'narration', 'details'),
+    'category': ('category',),
+    'type': ('type', 'transaction type', 'transaction_type'),
+    'currency': ('currency', 'ccy'),
+}
+
+_OFX_TOKEN = re.compile(r'<(/?)([A-Za-z0-9.]+)>([^<]*)')
+
+
+class ImportReport:
+    """
+    Outcome of an import, the row counts, elapsed time, error file and the
+    reason the file could not be read to its end
+    """
+    def __init__(self):
+        self.inserted = 0
+        self.rejected = 0
+        self.elapsed = 0.0
+        self.error_path = None
+        self.last_line = 0
+        self.failed = None
+
+    @property
+    def rows_per_second(self):
+        """
+        Return the number of rows processed per second
+        """
+        total = self.inserted + self.rejected
+        return total / self.elapsed if self.elapsed else float(total)
+
+    def __str__(self):
+        summary = (f'{self.inserted:,} transactions imported, {self.rejected:,} rejected in '
+                   f'{self.elapsed:.2f}s ({self.rows_per_second:,.0f} rows/s)')
+        if self.failed:
+            summary += (f', the file could not be read after line {self.last_line:,} '
+                        f'({self.failed}), only the rows up to it were imported')
+        return summary
+
+
+def read_csv_rows(stream):
+    """
+    Yield (line number, raw fields) of a CSV file with a header row, the
+    fields keyed by transaction field names
+    """
+    reader = csv.reader(stream)
+    header = [name.strip().lower() for name in next(reader, [])]
+    positions = {}
+    for field, names in CSV_COLUMNS.items():
+        for name in names:
+            if name in header:
+                positions[field] = header.index(name)
+                break
+
+    for values in reader:
+        if not any(values):
+            continue
+        yield reader.line_num, {field: values[position] if position < len(values) else ''
+                                for field, position in positions.items()}
+
+
+def read_ofx_rows(stream):
+    """
+    Yield (line number, raw fields) of the STMTTRN records of an OFX file,
+    SGML (unclosed tags) or XML, reading it line by line, with the currency
+    of their statement
+    """
+    record = None
+    start_line = 0
+    currency = ''
+    for line_number, line in enumerate(stream, 1):
+        for closing, tag, value in _OFX_TOKEN.findall(line):
+            tag = tag.upper()
+            if tag == 'STMTTRN':
+                if closing and record is not None:
+                    yield start_line, {
+                        'date': record.get('DTPOSTED', ''),
+                        'amount': record.get('TRNAMT', ''),
+                        'description': record.get('NAME') or record.get('MEMO', ''),
+                        'category': '',
+                        'type': '',
+                        'currency': currency,
+                    }
+                    record = None
+                elif not closing:
+                    record, start_line = {}, line_number
+            elif record is not None and not closing:
+                record[tag] = value.strip()
+            elif tag == 'CURDEF' and not closing:
+                currency = value.strip()
+
+
+def _read_rows(rows, report):
+    """
+    Yield the rows of a file until it cannot be decoded or parsed, recording
+    the last line read and the reason in the report
+    """
+    try:
+        for line_number, raw in rows:
+            report.last_line = line_number
+            yield line_number, raw
+    except (UnicodeDecodeError, csv.Error) as exc:
+        report.failed = str(exc)
+
+
+def _parse_date(value):
+    """
+    Parse an ISO (2024-01-31), OFX (20240131120000[0:GMT]) or day first
+    (31/01/2024) date
+    """
+    value = value.strip()
+    if re.fullmatch(r'\d{8}.*', value):
+        return date(int(value[:4]), int(value[4:6]), int(value[6:8]))
+    for pattern in ('%Y-%m-%d', '%d/%m/%Y', '%Y/%m/%d'):
+        try:
+            return datetime.strptime(value[:10], pattern).date()
+        except ValueError:
+            continue
+    raise ValueError(f'invalid date {value!r}')
+
+
+def _parse_type(value, amount):
+    """
+    Return the transaction type named by a field, or the one implied by the
+    sign of the amount when the field is empty
+    """
+    value = value.strip().lower()
+    if not value:
+        return TType.EXPENSE if amount.cents < 0 else TType.INCOME
+    if value in ('income', 'credit', 'cr', 'dep', 'deposit'):
+        return TType.INCOME
+    if value in ('expense', 'debit', 'dr', 'payment', 'pos', 'atm', 'fee'):
+        return TType.EXPENSE
+    raise ValueError(f'unknown transaction type {value!r}')
+
+
+def validate_row(raw, categories, default_category_id, currencies, default_currency):
+    """
+    Return the transaction values of a raw row, raising ValueError with the
+    reason when it cannot be imported
+    """
+    amount_text = raw.get('amount', '').strip()
+    if not amount_text:
+        raise ValueError('missing amount')
+    amount = Money.parse(amount_text)
+
+    description = raw.get('description', '').strip()
+    if not description:
+        raise ValueError('missing description')
+
+    category_name = raw.get('category', '').strip()
+    category_id = categories.get(category_name.lower()) if category_name else default_category_id
+    if category_id is None:
+        raise ValueError(f'unknown category {category_name!r}' if category_name
+                         else 'missing category')
+
+    currency = raw.get('currency', '').strip().upper() or default_currency
+    if currency not in currencies:
+        raise ValueError(f'unsupported currency {currency!r}')
+
+    return {
+        'category_id': category_id,
+        'amount': abs(amount),
+        'currency': currency,
+        'description': description,
+        'transaction_type': _parse_type(raw.get('type', ''), amount),
+        'date': _parse_date(raw.get('date', '')),
+    }
+
+
+def category_lookup():
+    """
+    Return the category ids keyed by lower case category name
+    """
+    rows = db.session.execute(select(Category.name, Category.id)).all()
+    return {name.lower(): category_id for name, category_id in rows}
+
+
+@contextmanager
+def _bulk_load_pragmas(connection):
+    """
+    Apply the IMPORT_SQLITE_PRAGMAS to a SQLite connection for the duration
+    of an import, restoring the previous values afterwards
+    """
+    pragmas = current_app.config['IMPORT_SQLITE_PRAGMAS'] \
+        if connection.dialect.name == 'sqlite' else {}
+    previous = {name: connection.exec_driver_sql(f'PRAGMA {name}').scalar()
+                for name in pragmas}
+    for name, value in pragmas.items():
+        connection.exec_driver_sql(f'PRAGMA {name} = {value}')
+    try:
+        yield
+    finally:
+        connection.rollback()
+        for name, value in previous.items():
+            connection.exec_driver_sql(f'PRAGMA {name} = {value}')
+
+
+def _insert_chunk(connection, rows):
+    """
+    Insert a chunk of transaction rows with their monthly summary deltas in
+    one transaction
+    """
+    connection.execute(Transaction.__table__.insert(), rows)
+    apply_rollup_deltas(connection, [
+        (rollup_key(row['user_id'], row['category_id'], row['date'],
+                    row['transaction_type'], row['currency']), row['amount'], 1)
+        for row in rows
+    ])
+    if current_app.config['ROW_COUNT_STRATEGIES'].get('transactions') == 'exact':
+        adjust_row_count(connection, 'transactions', len(rows))
+    connection.commit()
+
+
+def import_transactions(stream, file_format, user_id, error_path=None,
+                        default_category=None, chunk_size=None, currency=None):
+    """
+    Import the transactions of a CSV or OFX text stream for a user and return
+    an ImportReport, the rejected rows are written to error_path when given.
+    Rows without a currency take the given one, else BASE_CURRENCY
+    """
+    chunk_size = chunk_size or current_app.config['IMPORT_CHUNK_SIZE']
+    currencies = set(current_app.config['CURRENCIES'])
+    currency = currency or current_app.config['BASE_CURRENCY']
+    categories = category_lookup()
+    default_category_id = None
+    if default_category:
+        default_category_id = categories.get(default_category.lower())
+        if default_category_id is None:
+            raise ValueError(f'Unknown default category {default_category!r}')
+
+    rows = read_ofx_rows(stream) if file_format == 'ofx' else read_csv_rows(stream)
+    report = ImportReport()
+    rows = _read_rows(rows, report)
+    error_file = error_writer = None
+    start = time.perf_counter()
+    now = datetime.now()
+    try:
+        with db.engine.connect() as connection, _bulk_load_pragmas(connection):
+            while True:
+                chunk = list(islice(rows, chunk_size))
+                if not chunk:
+                    break
+
+                valid = []
+                for line_number, raw in chunk:
+                    try:
+                        values = validate_row(raw, categories, default_category_id,
+                                              currencies, currency)
+                    except ValueError as exc:
+                        report.rejected += 1
+                        if error_path is None:
+                            continue
+                        if error_writer is None:
+                            error_file = open(error_path, 'w', newline='', encoding='utf-8')
+                            error_writer = csv.writer(error_file)
+                            error_writer.writerow(['line', 'error', *CSV_COLUMNS])
+                        error_writer.writerow([line_number, str(exc),
+                                               *(raw.get(field, '') for field in CSV_COLUMNS)])
+                        continue
+                    values.update(id=generate_uuid(), created_at=now, updated_at=now, user_id=user_id)
+                    valid.append(values)
+
+                if valid:
+                    _insert_chunk(connection, valid)
+                    report.inserted += len(valid)
+    finally:
+        if error_file is not None:
+            error_file.close()
+            report.error_path = error_path
+
+    report.elapsed = time.perf_counter() - start
+    return report
+
+# End of file
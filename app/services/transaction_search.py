@@ -0,0 +1,206 @@
+"""
+Transaction search services.
+
+A search string is split into amount predicates and text terms. Amount
+tokens (`250`, `>500`, `<=20.5`, `100..200`) become exact or range filters
+on the indexed amount column. Text terms are prefix matched against the
+description and category name through an FTS5 table on SQLite, kept in sync
+by triggers on transactions and categories and keyed by the INTEGER PRIMARY
+KEY of transactions_search_keys, which VACUUM keeps unlike the implicit rowid
+of transactions, or a trigger-maintained tsvector column with a GIN index on
+PostgreSQL. Without a search index the text terms fall back to ILIKE
+filters.
+"""
+
+import re
+from sqlalchemy import and_, column, event, func, literal_column, or_, select, table
+from app.extensions import db
+from app.models.category import Category
+from app.models.transaction import Transaction
+from app.utils.money import Money
+from app.services.fulltext import (install_search_index, search_index_installed,
+                                   sqlite_match, tsquery_text)
+
+SQLITE_SEARCH_DDL = [
+    "CREATE TABLE IF NOT EXISTS transactions_search_keys ("
+    "search_rowid INTEGER PRIMARY KEY, id VARCHAR(36) NOT NULL UNIQUE)",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS transactions_fts USING fts5("
+    "description, category, prefix='2 3')",
+    "CREATE TRIGGER IF NOT EXISTS transactions_fts_insert AFTER INSERT ON transactions BEGIN "
+    "INSERT INTO transactions_search_keys(id) VALUES (new.id); "
+    "INSERT INTO transactions_fts(rowid, description, category) "
+    "VALUES ((SELECT search_rowid FROM transactions_search_keys WHERE id = new.id), "
+    "new.description, (SELECT name FROM categories WHERE id = new.category_id)); END",
+    "CREATE TRIGGER IF NOT EXISTS transactions_fts_update "
+    "AFTER UPDATE OF description, category_id ON transactions BEGIN "
+    "UPDATE transactions_fts SET description = new.description, "
+    "category = (SELECT name FROM categories WHERE id = new.category_id) "
+    "WHERE rowid = (SELECT search_rowid FROM transactions_search_keys WHERE id = new.id); END",
+    "CREATE TRIGGER IF NOT EXISTS transactions_fts_delete AFTER DELETE ON transactions BEGIN "
+    "DELETE FROM transactions_fts WHERE rowid = "
+    "(SELECT search_rowid FROM transactions_search_keys WHERE id = old.id); "
+    "DELETE FROM transactions_search_keys WHERE id = old.id; END",
+    "CREATE TRIGGER IF NOT EXISTS transactions_fts_category AFTER UPDATE OF name ON categories "
+    "BEGIN UPDATE transactions_fts SET category = new.name WHERE rowid IN "
+    "(SELECT k.search_rowid FROM transactions_search_keys k "
+    "JOIN transactions t ON t.id = k.id WHERE t.category_id = new.id); END",
+]
+
+POSTGRESQL_SEARCH_DDL = [
+    "ALTER TABLE transactions ADD COLUMN IF NOT EXISTS search_vector tsvector",
+    "CREATE OR REPLACE FUNCTION transactions_search_vector() RETURNS trigger AS $$ "
+    "BEGIN NEW.search_vector := to_tsvector('simple', coalesce(NEW.description, '') || ' ' || "
+    "coalesce((SELECT name FROM categories WHERE id = NEW.category_id), '')); "
+    "RETURN NEW; END $$ LANGUAGE plpgsql",
+    "DROP TRIGGER IF EXISTS transactions_search_vector ON transactions",
+    "CREATE TRIGGER transactions_search_vector BEFORE INSERT OR UPDATE ON transactions "
+    "FOR EACH ROW EXECUTE FUNCTION transactions_search_vector()",
+    "CREATE OR REPLACE FUNCTION categories_search_refresh() RETURNS trigger AS $$ "
+    "BEGIN UPDATE transactions SET search_vector = NULL WHERE category_id = NEW.id; "
+    "RETURN NULL; END $$ LANGUAGE plpgsql",
+    "DROP TRIGGER IF EXISTS categories_search_refresh ON categories",
+    "CREATE TRIGGER categories_search_refresh AFTER UPDATE OF name ON categories "
+    "FOR EACH ROW EXECUTE FUNCTION categories_search_refresh()",
+    "CREATE INDEX IF NOT EXISTS ix_transactions_search_vector ON transactions "
+    "USING GIN (search_vector)",
+]
+
+SEARCH_DDL = {
+    'sqlite': SQLITE_SEARCH_DDL,
+    'postgresql': POSTGRESQL_SEARCH_DDL
+}
+
+# Index the transactions written before the search index was installed
+SEARCH_BACKFILL = {
+    'sqlite': [
+        "INSERT OR IGNORE INTO transactions_search_keys(id) SELECT id FROM transactions",
+        "INSERT INTO transactions_fts(rowid, description, category) "
+        "SELECT k.search_rowid, t.description, c.name "
+        "FROM transactions t JOIN transactions_search_keys k ON k.id = t.id "
+        "LEFT JOIN categories c ON c.id = t.category_id",
+    ],
+    # Through the trigger
+    'postgresql': ["UPDATE transactions SET search_vector = NULL"],
+}
+
+SEARCH_DROP = {
+    'sqlite': [
+        "DROP TRIGGER IF EXISTS transactions_fts_insert",
+        "DROP TRIGGER IF EXISTS transactions_fts_update",
+        "DROP TRIGGER IF EXISTS transactions_fts_delete",
+        "DROP TRIGGER IF EXISTS transactions_fts_category",
+        "DROP TABLE IF EXISTS transactions_fts",
+        "DROP TABLE IF EXISTS transactions_search_keys",
+    ],
+    'postgresql': [
+        "DROP INDEX IF EXISTS ix_transactions_search_vector",
+        "DROP TRIGGER IF EXISTS categories_search_refresh ON categories",
+        "DROP FUNCTION IF EXISTS categories_search_refresh()",
+        "DROP TRIGGER IF EXISTS transactions_search_vector ON transactions",
+        "DROP FUNCTION IF EXISTS transactions_search_vector()",
+        "ALTER TABLE transactions DROP COLUMN IF EXISTS search_vector",
+    ],
+}
+
+_fts_table = table('transactions_fts', column('rowid'))
+_keys_table = table('transactions_search_keys', column('search_rowid'), column('id'))
+
+_NUMBER = r'\d[\d,]*(?:\.\d+)?'
+_COMPARISON = re.compile(rf'^(>=|<=|>|<|=)?({_NUMBER})$')
+_RANGE = re.compile(rf'^({_NUMBER})\.\.({_NUMBER})$')
+
+
+@event.listens_for(Transaction.__table__, 'after_create')
+def _install_after_create(target, connection, **kw):
+    """
+    Install the search index whenever db.create_all() creates the transactions
+    table, categories being created first as its foreign key target
+    """
+    install_search_index(connection, SEARCH_DDL)
+
+
+def _number(value):
+    """
+    Convert a searched amount, which may use thousands separators, to Money,
+    raising ValueError when it does not fit the amount column
+    """
+    return Money.parse(value)
+
+
+def parse_search(search):
+    """
+    Split a search string into amount predicates and lowercase text terms
+    """
+    amount = Transaction.amount
+    operators = {
+        '>': amount.__gt__,
+        '>=': amount.__ge__,
+        '<': amount.__lt__,
+        '<=': amount.__le__,
+        '=': amount.__eq__,
+        None: amount.__eq__
+    }
+
+    predicates = []
+    words = []
+    for token in search.split():
+        between = _RANGE.match(token)
+        comparison = _COMPARISON.match(token)
+        try:
+            if between:
+                low, high = sorted((_number(between.group(1)), _number(between.group(2))))
+                predicates.append(amount.between(low, high))
+            elif comparison:
+                predicates.append(operators[comparison.group(1)](_number(comparison.group(2))))
+            else:
+                words.append(token)
+        except ValueError:
+            # An amount too large for any transaction is ignored
+            continue
+
+    return predicates, re.findall(r'\w+', ' '.join(words).lower())
+
+
+def _fts_filter(dialect, terms):
+    """
+    Build the predicate selecting the transactions matching every term prefix
+    """
+    if dialect == 'sqlite':
+        matches = select(_keys_table.c.id).select_from(_fts_table) \
+            .join(_keys_table, _keys_table.c.search_rowid == _fts_table.c.rowid) \
+            .where(literal_column('transactions_fts').op('MATCH')(sqlite_match(terms)))
+        return Transaction.id.in_(matches)
+
+    vector = literal_column('transactions.search_vector')
+    return vector.op('@@')(func.to_tsquery('simple', tsquery_text(terms)))
+
+
+def _ilike_filter(terms):
+    """
+    Build the unindexed ILIKE predicate used when full-text search is unavailable
+    """
+    return and_(*(
+        or_(Transaction.description.ilike(f'%{term}%'),
+            Category.name.ilike(f'%{term}%'))
+        for term in terms
+    ))
+
+
+def search_transactions(query, search):
+    """
+    Filter a transaction query to the rows matching the search string, the
+    sorting and pagination of the query are left to the caller
+    """
+    predicates, terms = parse_search(search)
+    if predicates:
+        query = query.filter(*predicates)
+
+    if terms:
+        if search_index_installed('transactions_fts', 'transactions'):
+            query = query.filter(_fts_filter(db.engine.dialect.name, terms))
+        else:
+            query = query.join(Category, Category.id == Transaction.category_id) \
+                .filter(_ilike_filter(terms))
+    return query
+
+# End of file
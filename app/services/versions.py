@@ -0,0 +1,56 @@
+"""
+Cache versions shared by the processes through the cache_versions table.
+
+A process cache stamps its entries with the version of their name and
+reloads them once a write, made by any process, has bumped it. The versions
+are read once per request, in one query for the names a request asks for.
+"""
+
+import sqlalchemy.exc
+from flask import g, has_request_context
+from sqlalchemy import select
+from app.extensions import db
+from app.models.cache_version import CacheVersion
+
+
+def cache_versions(names):
+    """
+    Return the versions of the named caches, 0 for a name never bumped
+    """
+    known = g.setdefault('cache_versions', {}) if has_request_context() else {}
+    missing = [name for name in names if name not in known]
+    if missing:
+        rows = db.session.execute(select(CacheVersion.name, CacheVersion.version)
+                                  .where(CacheVersion.name.in_(missing))).all()
+        found = dict(rows)
+        for name in missing:
+            known[name] = found.get(name, 0)
+    return [known[name] for name in names]
+
+
+def cache_version(name):
+    """
+    Return the version of a named cache
+    """
+    return cache_versions([name])[0]
+
+
+def bump_cache_version(name):
+    """
+    Increment the version of a named cache and commit it, the processes
+    caching its data reload it on their next read
+    """
+    table = CacheVersion.__table__
+    bump = table.update().where(table.c.name == name).values(version=table.c.version + 1)
+    if db.session.execute(bump).rowcount == 0:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(table.insert().values(name=name, version=1))
+        except sqlalchemy.exc.IntegrityError:
+            # Another process added the version first
+            db.session.execute(bump)
+    db.session.commit()
+    if has_request_context():
+        g.get('cache_versions', {}).pop(name, None)
+
+# End of file
@@ -9,61 +9,49 @@ from functools import wraps
 from contextlib import contextmanager
 import sqlalchemy.exc
 from flask import g, request, current_app
-from app.extensions import db
-from app.models.auditlog import Auditlog  # Adjust import based on your model location
+from app.utils.audit_writer import audit_writer
+
+def build_audit_record(action, resource_type=None, resource_id=None, description=None,
+                       details=None):
+    """
+    Build an audit record for the current user and request
+    """
+    # Get user ID if available, otherwise use 'anonymous'
+    user_id = 'anonymous'
+    if hasattr(g, 'user') and g.user:
+        user_id = g.user.id
+
+    # Get request ID or generate a new one
+    request_id = getattr(g, 'request_id', str(uuid.uuid4()))
+
+    now = datetime.now()
+    return {
+        'id': str(uuid.uuid4()),
+        'timestamp': now,
+        'created_at': now,
+        'created_by': user_id,
+        'updated_by': user_id,
+        'request_id': request_id,
+        'user_id': user_id,
+        'action': action,
+        'resource_type': resource_type,
+        'resource_id': resource_id,
+        'description': description,
+        'ip_address': request.remote_addr if request else None,
+        'user_agent': request.user_agent.string if request and request.user_agent else None,
+        'details': json.dumps(details) if details else None
+    }
+
 
 def log_audit(action, resource_type=None, resource_id=None, description=None, details=None):
     """
-    Log an audit event both to file and database
+    Log an audit event both to file and database, without blocking the request
+    on either write
     """
     try:
-        # Get user ID if available, otherwise use 'anonymous'
-        user_id = 'anonymous'
-        if hasattr(g, 'user') and g.user:
-            user_id = g.user.id
-
-        # Get request ID or generate a new one
-        request_id = getattr(g, 'request_id', str(uuid.uuid4()))
-
-        # Create log entry
-        log_entry = {
-            'timestamp': datetime.now().isoformat(),
-            'request_id': request_id,
-            'user_id': user_id,
-            'action': action,
-            'resource_type': resource_type,
-            'resource_id': resource_id,
-            'description': description,
-            'ip_address': request.remote_addr if request else None,
-            'user_agent': request.user_agent.string if request and request.user_agent else None,
-            'details': json.dumps(details) if details else None
-        }
-
-        # Log to audit log file
-        try:
-            current_app.audit_logger.info(json.dumps(log_entry))
-        except (AttributeError, TypeError) as logger_error:
-            current_app.logger.error(f'Failed to write to audit log file: {str(logger_error)}')
-
-        # Store in database
-        try:
-            audit_record = Auditlog(
-                user_id=user_id,
-                action=action,
-                resource_type=resource_type,
-                resource_id=resource_id,
-                description=description,
-                ip_address=log_entry['ip_address'],
-                user_agent=log_entry['user_agent'],
-                request_id=log_entry['request_id'],
-                details=log_entry['details']
-            )
-            db.session.add(audit_record)
-            db.session.commit()
-        except sqlalchemy.exc.SQLAlchemyError as db_error:
-            current_app.logger.error(f'Failed to write audit record to database: {str(db_error)}')
-            # Rollback the session to avoid transaction issues
-            db.session.rollback()
+        # Written to the audit log file and database by the background audit writer
+        audit_writer.submit(build_audit_record(action, resource_type, resource_id,
+                                               description, details))
 
     except (AttributeError, TypeError, ValueError) as e:
         # These are the most likely errors when accessing attributes or formatting data
@@ -157,14 +145,25 @@ def audit_context(action, resource_type=None, resource_id=None, description=None
 
 def log_bulk_audit(action, resource_type, resource_ids, description=None, details=None):
     """
-    Log a bulk operation to the audit trail
+    Log a bulk operation to the audit trail as one record per resource, written
+    with a multi-row insert per chunk of AUDIT_BULK_CHUNK_SIZE records
     """
-    log_audit(
-        action=action,
-        resource_type=resource_type,
-        resource_id=",".join(str(id) for id in resource_ids),
-        description=description or f"Bulk {action} on {len(resource_ids)} {resource_type} items",
-        details={"resource_ids": resource_ids, **(details or {})}
-    )
+    try:
+        description = description or f"Bulk {action} on {len(resource_ids)} {resource_type} items"
+        details = {"bulk_size": len(resource_ids), **(details or {})}
+
+        # The user, request and details are the same for every resource
+        base = build_audit_record(action, resource_type, None, description, details)
+        chunk_size = current_app.config['AUDIT_BULK_CHUNK_SIZE']
+
+        for offset in range(0, len(resource_ids), chunk_size):
+            chunk = resource_ids[offset:offset + chunk_size]
+            audit_writer.write_many([{**base,
+                                      'id': str(uuid.uuid4()),
+                                      'resource_id': str(resource_id)}
+                                     for resource_id in chunk])
+
+    except (AttributeError, TypeError, ValueError) as e:
+        current_app.logger.error(f'Error preparing bulk audit log data: {str(e)}')
 
 # End of file
@@ -0,0 +1,196 @@
+"""
+Background audit writer that batches audit records off the request thread
+"""
+
+import os
+import json
+import time
+import queue
+import atexit
+import threading
+import sqlalchemy.exc
+from app.extensions import db
+from app.models.auditlog import Auditlog
+
+# Queue sentinel asking the writer thread to drain and stop
+_STOP = object()
+
+
+class AuditWriter:
+    """
+    Bounded in-process queue of audit records flushed in batches by a
+    background thread, on its own connection, to the audit log file and the
+    auditlogs table
+    """
+    def __init__(self, app=None):
+        self.app = None
+        self.queue = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.metrics = {
+            'enqueued': 0,
+            'written': 0,
+            'dropped': 0,
+            'spilled': 0,
+            'failed': 0,
+            'batches': 0
+        }
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        A function to configure the writer from the app config
+        """
+        self.app = app
+        self.enabled = app.config['AUDIT_ASYNC']
+        self.batch_size = app.config['AUDIT_BATCH_SIZE']
+        self.flush_interval = app.config['AUDIT_FLUSH_INTERVAL_MS'] / 1000
+        self.policy = app.config['AUDIT_QUEUE_POLICY']
+        self.spill_file = os.path.join(app.config['LOG_DIR'], 'audit_spill.jsonl')
+        self.queue = queue.Queue(maxsize=app.config['AUDIT_QUEUE_SIZE'])
+        atexit.register(self.shutdown)
+
+    def _ensure_started(self):
+        """
+        Start the writer thread, once per process so forked workers get their
+        own. A forked worker starts on a new queue, the parent's records and
+        its queue lock are not its own, while a thread that died in this
+        process is restarted on the existing queue so no record is lost
+        """
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            if self._pid != os.getpid():
+                self.queue = queue.Queue(maxsize=self.queue.maxsize)
+                self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+            self._thread.start()
+
+    def _count(self, name, value=1):
+        """
+        Add to a writer counter under the lock
+        """
+        with self._lock:
+            self.metrics[name] += value
+
+    def submit(self, record):
+        """
+        Queue an audit record, applying the back-pressure policy when full
+        """
+        if not self.enabled:
+            self._write([record])
+            return
+
+        self._ensure_started()
+        try:
+            if self.policy == 'block':
+                self.queue.put(record)
+            else:
+                self.queue.put_nowait(record)
+            self._count('enqueued')
+        except queue.Full:
+            if self.policy == 'spill':
+                self._spill([record])
+            else:
+                self._count('dropped')
+
+    def write_many(self, records):
+        """
+        Write a large batch of records at once, bypassing the queue so bulk
+        operations do not flood it
+        """
+        self._write(records)
+
+    def _run(self):
+        """
+        Collect records into batches of batch_size or flush_interval and write them
+        """
+        running = True
+        while running:
+            batch = []
+            deadline = None
+            while len(batch) < self.batch_size:
+                try:
+                    if batch:
+                        record = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+                    else:
+                        record = self.queue.get()
+                except queue.Empty:
+                    break
+                if record is _STOP:
+                    running = False
+                    break
+                if deadline is None:
+                    # The flush interval runs from the first record of the
+                    # batch, not from the wait for it
+                    deadline = time.monotonic() + self.flush_interval
+                batch.append(record)
+            if batch:
+                try:
+                    self._write(batch)
+                except Exception as error:  # pylint: disable=broad-except
+                    # Keep the thread, and the records still queued, alive
+                    self._count('failed', len(batch))
+                    self.app.logger.error(f'Audit writer failed on {len(batch)} records: {error}')
+                    self._spill(batch)
+
+    def _write(self, batch):
+        """
+        Write a batch of records to the audit log file and to the database with a
+        single multi-row insert
+        """
+        with self.app.app_context():
+            for record in batch:
+                self.app.audit_logger.info(json.dumps(record, default=str))
+
+            try:
+                with db.engine.begin() as connection:
+                    connection.execute(Auditlog.__table__.insert(), batch)
+                self._count('written', len(batch))
+                self._count('batches')
+            except sqlalchemy.exc.SQLAlchemyError as db_error:
+                self._count('failed', len(batch))
+                self.app.logger.error(f'Failed to write {len(batch)} audit records '
+                                      f'to database: {str(db_error)}')
+                self._spill(batch)
+
+    def _spill(self, batch):
+        """
+        Append records that could not be queued or written to the spill file
+        """
+        with self._lock:
+            with open(self.spill_file, 'a', encoding='utf-8') as spill:
+                for record in batch:
+                    spill.write(json.dumps(record, default=str) + '\n')
+            self.metrics['spilled'] += len(batch)
+
+    def stats(self):
+        """
+        Return the writer counters with the current queue depth
+        """
+        with self._lock:
+            metrics = dict(self.metrics)
+        return {
+            'queue_depth': self.queue.qsize() if self.queue else 0,
+            'queue_size': self.queue.maxsize if self.queue else 0,
+            **metrics
+        }
+
+    def shutdown(self, timeout=10):
+        """
+        Drain the queue and stop the writer thread
+        """
+        if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+            return
+        self.queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+
+audit_writer = AuditWriter()
+
+# End of file
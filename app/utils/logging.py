@@ -3,11 +3,227 @@ Logging configuration utilities
 """
 
 import os
+import json
 import time
 import uuid
+import queue
+import random
+import atexit
 import logging
-from logging.handlers import RotatingFileHandler, SMTPHandler
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, SMTPHandler
 from flask import g, request
+from app.utils.profiling import server_timing, slowest_statements
+
+try:
+    import fcntl
+except ImportError:
+    # Windows, the log files then rotate safely from a single process only
+    fcntl = None
+
+# Logger name: queue handler feeding the background listener of its handlers
+_queue_handlers = {}
+
+
+class LogQueueListener(QueueListener):
+    """
+    Queue listener whose stop waits for room in a full queue to drain it
+    """
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Queue handler that hands records to a background listener thread, counting
+    and dropping them instead of blocking when the bounded queue is full,
+    unless block is set
+    """
+    def __init__(self, log_queue, handlers, block=False):
+        super().__init__(log_queue)
+        self.handlers = handlers
+        self.block = block
+        self.listener = None
+        self.pid = None
+        self.enqueued = 0
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self.start()
+
+    def start(self):
+        """
+        Start the listener thread, again in a forked worker which inherits the
+        queue but not the thread
+        """
+        with self._lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.listener = LogQueueListener(self.queue, *self.handlers,
+                                             respect_handler_level=True)
+            self.listener.start()
+
+    def enqueue(self, record):
+        if self.pid != os.getpid():
+            self.start()
+        try:
+            self.queue.put(record, block=self.block)
+            self.enqueued += 1
+        except queue.Full:
+            self.dropped += 1
+
+    def stop(self):
+        """
+        Write the queued records, stop the listener thread and close the handlers
+        """
+        if self.pid == os.getpid() and self.listener._thread is not None:
+            self.listener.stop()
+        for handler in self.handlers:
+            handler.close()
+
+
+def attach_queue_handler(app, logger, handlers, block=False):
+    """
+    Attach handlers to a logger through a bounded queue, so the file and SMTP
+    I/O runs on a background thread instead of the logging thread
+    """
+    previous = _queue_handlers.pop(logger.name, None)
+    if previous is not None:
+        previous.stop()
+
+    queue_handler = DroppingQueueHandler(queue.Queue(maxsize=app.config['LOG_QUEUE_SIZE']),
+                                         handlers, block)
+    logger.addHandler(queue_handler)
+    _queue_handlers[logger.name] = queue_handler
+    return queue_handler
+
+
+def log_queue_stats():
+    """
+    Return the queue depth and the enqueued and dropped record counts of
+    every queued logger
+    """
+    return {
+        name: {
+            'queue_depth': handler.queue.qsize(),
+            'enqueued': handler.enqueued,
+            'dropped': handler.dropped
+        }
+        for name, handler in _queue_handlers.items()
+    }
+
+
+@atexit.register
+def flush_log_queues():
+    """
+    Drain the log queues on exit
+    """
+    for handler in list(_queue_handlers.values()):
+        handler.stop()
+    _queue_handlers.clear()
+
+
+class MultiProcessRotatingFileHandler(RotatingFileHandler):
+    """
+    Rotating file handler safe to share between worker processes.
+
+    Every record is appended with O_APPEND while holding an exclusive lock on
+    a sidecar .lock file. Under the lock the handler reopens the log if another
+    process rotated it, checks the size of the file on disk and rotates it
+    itself when the record would not fit, so no rotation races a write. The
+    flock belongs to the open file, which a forked process shares with its
+    parent, so every process opens the lock file again for itself.
+    """
+    def __init__(self, filename, maxBytes=0, backupCount=0, encoding=None):
+        super().__init__(filename, mode='a', maxBytes=maxBytes,
+                         backupCount=backupCount, encoding=encoding)
+        self.lock_file = None
+        self._lock_pid = None
+
+    def _process_lock_file(self):
+        """
+        Return the lock file opened by the current process
+        """
+        if self._lock_pid != os.getpid():
+            if self.lock_file is not None:
+                # The parent's open file, closing this copy keeps its lock
+                self.lock_file.close()
+            self.lock_file = open(self.baseFilename + '.lock', 'a', encoding='utf-8')
+            self._lock_pid = os.getpid()
+        return self.lock_file
+
+    def _reopen_if_rotated(self):
+        """
+        Reopen the log file when the open stream is no longer the file on disk
+        """
+        try:
+            on_disk = os.stat(self.baseFilename)
+        except FileNotFoundError:
+            on_disk = None
+        if self.stream is not None:
+            opened = os.fstat(self.stream.fileno())
+            if on_disk is not None and \
+                    (on_disk.st_dev, on_disk.st_ino) == (opened.st_dev, opened.st_ino):
+                return
+            self.stream.close()
+        self.stream = self._open()
+
+    def emit(self, record):
+        if fcntl is None:
+            # No fcntl on this platform, single process rotation only
+            super().emit(record)
+            return
+
+        try:
+            message = self.format(record) + self.terminator
+            lock_file = self._process_lock_file()
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._reopen_if_rotated()
+                size = os.fstat(self.stream.fileno()).st_size
+                if self.maxBytes > 0 and size > 0 and \
+                        size + len(message.encode(self.encoding or 'utf-8')) > self.maxBytes:
+                    self.doRollover()
+                self.stream.write(message)
+                self.stream.flush()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        except Exception:  # pylint: disable=broad-except
+            self.handleError(record)
+
+    def close(self):
+        super().close()
+        if self.lock_file is not None:
+            self.lock_file.close()
+            self.lock_file = None
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formatter writing each record as a JSON line, merged with the structured
+    fields passed in the record extra
+    """
+    def format(self, record):
+        entry = {
+            'timestamp': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        entry.update(getattr(record, 'fields', None) or {})
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def _sampled(app, endpoint):
+    """
+    Decide if the successful completion of a request is logged, from the
+    sample rate of its endpoint
+    """
+    rate = app.config['LOG_SAMPLE_RATES'].get(endpoint, app.config['LOG_SAMPLE_RATE'])
+    return rate >= 1 or random.random() < rate
+
 
 def setup_logger(app):
     """
@@ -26,11 +242,12 @@ def setup_logger(app):
     if app_logger.handlers:
         app_logger.handlers.clear()
 
-    # Create formatter
-    formatter = logging.Formatter(app.config['LOG_FORMAT'])
+    # Create formatter, JSON lines when LOG_JSON is set
+    formatter = JsonFormatter() if app.config['LOG_JSON'] \
+        else logging.Formatter(app.config['LOG_FORMAT'])
 
     # File handler (rotating)
-    file_handler = RotatingFileHandler(
+    file_handler = MultiProcessRotatingFileHandler(
         os.path.join(app.config['LOG_DIR'], 'app.log'),
         maxBytes=app.config['LOG_FILE_MAX_BYTES'],
         backupCount=app.config['LOG_BACKUP_COUNT']
@@ -39,7 +256,7 @@ def setup_logger(app):
     file_handler.setLevel(getattr(logging, app.config['LOG_LEVEL']))
 
     # Error-specific file handler
-    error_file_handler = RotatingFileHandler(
+    error_file_handler = MultiProcessRotatingFileHandler(
         os.path.join(app.config['LOG_DIR'], 'error.log'),
         maxBytes=app.config['LOG_FILE_MAX_BYTES'],
         backupCount=app.config['LOG_BACKUP_COUNT']
@@ -47,16 +264,18 @@ def setup_logger(app):
     error_file_handler.setFormatter(formatter)
     error_file_handler.setLevel(logging.ERROR)
 
+    handlers = []
+
     # Console handler (only in development)
     if app.debug:
         console_handler = logging.StreamHandler()
         console_handler.setFormatter(formatter)
         console_handler.setLevel(getattr(logging, app.config['LOG_LEVEL']))
-        app_logger.addHandler(console_handler)
+        handlers.append(console_handler)
 
     # Add handlers
-    app_logger.addHandler(file_handler)
-    app_logger.addHandler(error_file_handler)
+    handlers.append(file_handler)
+    handlers.append(error_file_handler)
 
     # Email handler for errors in production
     if not app.debug and app.config.get('MAIL_SERVER'):
@@ -69,25 +288,78 @@ def setup_logger(app):
             secure=() if app.config.get('MAIL_USE_TLS') else None
         )
         mail_handler.setLevel(logging.ERROR)
-        app_logger.addHandler(mail_handler)
+        handlers.append(mail_handler)
+
+    # The handlers write from a background thread fed by a bounded queue
+    attach_queue_handler(app, app_logger, handlers)
 
     # Register request tracking middleware
     @app.before_request
     def before_request():
         g.start_time = time.time()
         g.request_id = request.headers.get('X-Request-ID', str(uuid.uuid4()))
-        app_logger.info("[%s] %s %s started", g.request_id, request.method, request.path)
+        g.log_sampled = _sampled(app, request.endpoint)
+        if g.log_sampled:
+            app_logger.info("[%s] %s %s started", g.request_id, request.method, request.path,
+                            extra={'fields': {'event': 'request_started',
+                                              'request_id': g.request_id,
+                                              'method': request.method,
+                                              'path': request.path}})
 
         if app.debug and request.is_json:
             app_logger.debug("[%s] Request Body: %s", g.request_id, request.get_json())
 
     @app.after_request
     def after_request(response):
-        if hasattr(g, 'start_time'):
-            elapsed = time.time() - g.start_time
+        if not hasattr(g, 'start_time'):
+            return response
+
+        elapsed = time.time() - g.start_time
+        profile = g.get('sql_profile')
+        if profile is not None and app.config['SERVER_TIMING']:
+            response.headers['Server-Timing'] = server_timing(profile, elapsed)
+
+        # Fast path, a sampled out successful request is never formatted
+        slow = elapsed * 1000 >= app.config['LOG_SLOW_REQUEST_MS']
+        if not (g.get('log_sampled', True) or slow or response.status_code >= 400) \
+                or not app_logger.isEnabledFor(logging.INFO):
+            return response
+
+        # The user loaded by the login manager, without loading one
+        user = g.get('_login_user')
+        fields = {
+            'event': 'request_completed',
+            'request_id': g.request_id,
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'duration': round(elapsed, 4),
+            'user_id': getattr(user, 'id', None)
+        }
+
+        if profile is None:
             app_logger.info("[%s] %s %s completed with status %s in %.4fs",
                             g.request_id, request.method, request.path,
-                            response.status_code, elapsed)
+                            response.status_code, elapsed, extra={'fields': fields})
+            return response
+
+        slowest = slowest_statements(profile)
+        fields.update({
+            'queries': profile['count'],
+            'db_time': round(profile['db_time'], 4),
+            'render_time': round(profile['render_time'], 4),
+            'slowest': [{'duration': round(seconds, 4), 'statement': statement}
+                        for seconds, statement in slowest]
+        })
+        app_logger.info("[%s] %s %s completed with status %s in %.4fs, "
+                        "%d queries in %.4fs, render %.4fs, slowest: %s",
+                        g.request_id, request.method, request.path,
+                        response.status_code, elapsed, profile['count'],
+                        profile['db_time'], profile['render_time'],
+                        '; '.join(f'{seconds:.4f}s {statement[:120]}'
+                                  for seconds, statement in slowest) or '-',
+                        extra={'fields': fields})
         return response
 
     @app.errorhandler(Exception)
@@ -128,18 +400,52 @@ def setup_audit_logger(app):
     audit_formatter = logging.Formatter('%(asctime)s - %(message)s')
 
     # Audit file handler (rotating)
-    audit_file_handler = RotatingFileHandler(
+    audit_file_handler = MultiProcessRotatingFileHandler(
         os.path.join(app.config['LOG_DIR'], 'audit.log'),
         maxBytes=app.config['LOG_FILE_MAX_BYTES'],
         backupCount=app.config['LOG_BACKUP_COUNT']
     )
     audit_file_handler.setFormatter(audit_formatter)
     audit_file_handler.setLevel(logging.INFO)
-    audit_logger.addHandler(audit_file_handler)
+    # Audit lines wait for room in the queue rather than being dropped
+    attach_queue_handler(app, audit_logger, [audit_file_handler], block=True)
 
     # Make audit_logger available to the app
     app.audit_logger = audit_logger
 
     return audit_logger
 
+
+# Slow query logger setup
+def setup_slow_query_logger(app):
+    """
+    A function to setup the slow query logger
+    """
+    # Create logs directory if it doesn't exist
+    if not os.path.exists(app.config['LOG_DIR']):
+        os.makedirs(app.config['LOG_DIR'])
+
+    # Slow query logger
+    slow_query_logger = logging.getLogger('slow_query')
+    slow_query_logger.setLevel(logging.WARNING)
+    slow_query_logger.propagate = False
+
+    # Clear handlers to avoid duplicates
+    if slow_query_logger.handlers:
+        slow_query_logger.handlers.clear()
+
+    # Slow query file handler (rotating)
+    slow_query_file_handler = MultiProcessRotatingFileHandler(
+        os.path.join(app.config['LOG_DIR'], 'slow_query.log'),
+        maxBytes=app.config['LOG_FILE_MAX_BYTES'],
+        backupCount=app.config['LOG_BACKUP_COUNT']
+    )
+    slow_query_file_handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
+    attach_queue_handler(app, slow_query_logger, [slow_query_file_handler])
+
+    # Make slow_query_logger available to the app
+    app.slow_query_logger = slow_query_logger
+
+    return slow_query_logger
+
 # End of file
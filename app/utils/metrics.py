@@ -0,0 +1,494 @@
+"""
+In-process metrics registry exposed at /metrics in the Prometheus text format.
+
+Every process writes its samples to its own memory mapped file in METRICS_DIR,
+so gunicorn workers never share a write path, and a scrape served by any
+worker merges the files of all of them. Counters and histograms are summed
+across every file, gauges only across the processes still alive. The
+counters of exited processes are merged into an aggregate file when the
+application starts, so their files can be removed without the totals going
+back down. The endpoint only answers METRICS_ALLOWED_NETWORKS.
+"""
+
+import os
+import json
+import mmap
+import time
+import struct
+import ipaddress
+import threading
+from flask import Response, g, request
+from app.extensions import db
+from app.utils.audit_writer import audit_writer
+from app.utils.logging import log_queue_stats
+
+try:
+    import fcntl
+except ImportError:
+    # Windows, the files of exited processes are then kept as they are
+    fcntl = None
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Metric name: (type, help)
+METRICS = {
+    'http_requests_total': ('counter', 'HTTP requests by method, endpoint and status'),
+    'http_request_duration_seconds': ('histogram', 'HTTP request latency by endpoint'),
+    'http_requests_in_flight': ('gauge', 'HTTP requests being served'),
+    'db_pool_size': ('gauge', 'Database connection pool size'),
+    'db_pool_checked_out': ('gauge', 'Database connections in use'),
+    'db_pool_checked_in': ('gauge', 'Idle database connections in the pool'),
+    'db_pool_overflow': ('gauge', 'Database connections opened over the pool size'),
+    'audit_queue_depth': ('gauge', 'Audit records waiting for the background writer'),
+    'audit_queue_size': ('gauge', 'Capacity of the audit record queue'),
+    'log_queue_depth': ('gauge', 'Log records waiting for the log writer thread'),
+    'log_records_dropped_total': ('counter', 'Log records dropped on a full log queue'),
+}
+
+_HEADER = struct.Struct('i4x')
+_LENGTH = struct.Struct('i')
+_VALUE = struct.Struct('d')
+
+# Counters and histograms of the exited processes
+AGGREGATE_FILE = 'metrics_aggregate.db'
+
+
+class MmapedValues:
+    """
+    Append-only mapping of keys to float values in a memory mapped file.
+
+    The file starts with the number of bytes used, followed by entries made of
+    the key length, the UTF-8 key padded to 8 bytes and a double. An entry is
+    written before the used size is bumped, so readers never see half of it.
+    """
+    INITIAL_SIZE = 1 << 16
+
+    def __init__(self, path, read_only=False):
+        self.path = path
+        self.read_only = read_only
+        self._file = open(path, 'rb' if read_only else 'a+b')
+        if not read_only and os.fstat(self._file.fileno()).st_size == 0:
+            self._file.truncate(self.INITIAL_SIZE)
+        self._capacity = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), self._capacity,
+                              access=mmap.ACCESS_READ if read_only else mmap.ACCESS_WRITE)
+        self._used = _HEADER.unpack_from(self._map, 0)[0] or _HEADER.size
+        if not read_only:
+            _HEADER.pack_into(self._map, 0, self._used)
+        self._positions = {key: position for key, _, position in self._entries()}
+
+    def _entries(self):
+        """
+        Yield the (key, value, value position) of every entry, a reader
+        stopping at the end of its mapping when the writer grew the file
+        after it was mapped
+        """
+        end = min(self._used, len(self._map))
+        position = _HEADER.size
+        while position + _LENGTH.size <= end:
+            length = _LENGTH.unpack_from(self._map, position)[0]
+            start = position + _LENGTH.size
+            value_position = start + length + (-(length + _LENGTH.size) % 8)
+            if value_position + _VALUE.size > end:
+                return
+            key = self._map[start:start + length].decode('utf-8')
+            yield key, _VALUE.unpack_from(self._map, value_position)[0], value_position
+            position = value_position + _VALUE.size
+
+    def items(self):
+        """
+        Return the (key, value) of every entry
+        """
+        return [(key, value) for key, value, _ in self._entries()]
+
+    def _grow(self, needed):
+        """
+        Double the file until it fits needed bytes and map it again
+        """
+        capacity = self._capacity
+        while capacity < needed:
+            capacity *= 2
+        self._map.close()
+        self._file.truncate(capacity)
+        self._capacity = capacity
+        self._map = mmap.mmap(self._file.fileno(), capacity, access=mmap.ACCESS_WRITE)
+
+    def _position(self, key):
+        """
+        Return the value position of a key, appending a zero entry if missing
+        """
+        position = self._positions.get(key)
+        if position is not None:
+            return position
+
+        encoded = key.encode('utf-8')
+        padding = -(len(encoded) + _LENGTH.size) % 8
+        size = _LENGTH.size + len(encoded) + padding + _VALUE.size
+        if self._used + size > self._capacity:
+            self._grow(self._used + size)
+
+        start = self._used
+        _LENGTH.pack_into(self._map, start, len(encoded))
+        self._map[start + _LENGTH.size:start + _LENGTH.size + len(encoded)] = encoded
+        position = start + _LENGTH.size + len(encoded) + padding
+        _VALUE.pack_into(self._map, position, 0.0)
+        self._used += size
+        _HEADER.pack_into(self._map, 0, self._used)
+        self._positions[key] = position
+        return position
+
+    def increment(self, key, amount):
+        """
+        Add an amount to the value of a key
+        """
+        position = self._position(key)
+        value = _VALUE.unpack_from(self._map, position)[0]
+        _VALUE.pack_into(self._map, position, value + amount)
+
+    def set(self, key, value):
+        """
+        Set the value of a key
+        """
+        _VALUE.pack_into(self._map, self._position(key), value)
+
+    def close(self):
+        """
+        Unmap and close the file
+        """
+        self._map.close()
+        self._file.close()
+
+
+def _process_alive(pid):
+    """
+    Check if a process id is running
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _key(name, labels=None):
+    """
+    Encode a sample name and labels into a store key
+    """
+    return json.dumps([name, labels or {}], sort_keys=True, separators=(',', ':'))
+
+
+def _escape(value):
+    """
+    Escape a label value of the text exposition format
+    """
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    """
+    Format a sample value, integers without a decimal part
+    """
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+class MetricsRegistry:
+    """
+    Registry of the request, database pool and audit queue metrics of the
+    processes sharing METRICS_DIR
+    """
+    def __init__(self, app=None):
+        self.directory = None
+        self._values = None
+        self._pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        A function to prepare the metrics directory and register the request
+        hooks and the /metrics endpoint
+        """
+        if not app.config['METRICS_ENABLED']:
+            return
+
+        self.directory = app.config['METRICS_DIR']
+        os.makedirs(self.directory, exist_ok=True)
+        self.allowed_networks = [ipaddress.ip_network(network)
+                                 for network in app.config['METRICS_ALLOWED_NETWORKS']]
+        self._merge_dead_processes()
+
+        app.before_request(self._request_started)
+        app.after_request(self._request_finished)
+        app.teardown_request(self._request_teardown)
+        app.add_url_rule('/metrics', 'metrics', self.metrics_view)
+
+    def _path(self, pid):
+        """
+        Return the store file of a process
+        """
+        return os.path.join(self.directory, f'metrics_{pid}.db')
+
+    def _pids(self):
+        """
+        Return the process ids having a store file
+        """
+        pids = []
+        for name in os.listdir(self.directory):
+            pid = name[len('metrics_'):-len('.db')]
+            if name.startswith('metrics_') and name.endswith('.db') and pid.isdigit():
+                pids.append(int(pid))
+        return pids
+
+    def _merge_dead_processes(self):
+        """
+        Add the counters and histograms of the exited processes to the
+        aggregate file and remove their files, their gauges being dropped.
+        The new aggregate replaces the old one once complete, under a lock
+        so two starting workers do not merge the same files
+        """
+        if fcntl is None:
+            return
+
+        with open(os.path.join(self.directory, 'metrics.lock'), 'a+b') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            dead = [pid for pid in self._pids() if not _process_alive(pid)]
+            if not dead:
+                return
+
+            aggregate = os.path.join(self.directory, AGGREGATE_FILE)
+            merged_path = f'{aggregate}.tmp'
+            if os.path.exists(merged_path):
+                os.remove(merged_path)
+            merged = MmapedValues(merged_path)
+            try:
+                for path in [aggregate] + [self._path(pid) for pid in dead]:
+                    if not os.path.exists(path):
+                        continue
+                    values = MmapedValues(path, read_only=True)
+                    try:
+                        items = values.items()
+                    finally:
+                        values.close()
+                    for key, value in items:
+                        if _metric_type(json.loads(key)[0]) != 'gauge':
+                            merged.increment(key, value)
+            finally:
+                merged.close()
+            os.replace(merged_path, aggregate)
+            for pid in dead:
+                os.remove(self._path(pid))
+
+    def _store(self):
+        """
+        Return the store of the current process, opened again after a fork
+        """
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._values = MmapedValues(self._path(self._pid))
+        return self._values
+
+    def increment(self, name, labels=None, amount=1):
+        """
+        Increment a counter or gauge sample
+        """
+        with self._lock:
+            self._store().increment(_key(name, labels), amount)
+
+    def set(self, name, value, labels=None):
+        """
+        Set a gauge sample of the current process
+        """
+        with self._lock:
+            self._store().set(_key(name, labels), value)
+
+    def observe(self, name, value, labels=None):
+        """
+        Record a histogram observation
+        """
+        labels = labels or {}
+        bucket = next((str(bound) for bound in LATENCY_BUCKETS if value <= bound), '+Inf')
+        with self._lock:
+            store = self._store()
+            store.increment(_key(f'{name}_bucket', {**labels, 'le': bucket}), 1)
+            store.increment(_key(f'{name}_sum', labels), value)
+            store.increment(_key(f'{name}_count', labels), 1)
+
+    def _request_started(self):
+        """
+        Count the request in flight
+        """
+        g.metrics_start_time = time.perf_counter()
+        self.increment('http_requests_in_flight')
+
+    def _request_finished(self, response):
+        """
+        Remember the response status for the teardown
+        """
+        g.metrics_status = response.status_code
+        return response
+
+    def _request_teardown(self, exc):
+        """
+        Record the request latency and status, unhandled errors as a 500
+        """
+        start = g.pop('metrics_start_time', None)
+        if start is None:
+            return
+        endpoint = request.endpoint or 'none'
+        status = g.get('metrics_status', 500)
+        self.increment('http_requests_in_flight', amount=-1)
+        self.increment('http_requests_total', {'method': request.method,
+                                               'endpoint': endpoint,
+                                               'status': str(status)})
+        self.observe('http_request_duration_seconds', time.perf_counter() - start,
+                     {'endpoint': endpoint})
+        self._record_gauges()
+
+    def _record_gauges(self):
+        """
+        Store the database pool and audit queue gauges of the current process
+        """
+        pool = db.engine.pool
+        for name, method in (('db_pool_size', 'size'),
+                             ('db_pool_checked_out', 'checkedout'),
+                             ('db_pool_checked_in', 'checkedin'),
+                             ('db_pool_overflow', 'overflow')):
+            if hasattr(pool, method):
+                self.set(name, getattr(pool, method)())
+
+        stats = audit_writer.stats()
+        self.set('audit_queue_depth', stats['queue_depth'])
+        self.set('audit_queue_size', stats['queue_size'])
+
+        for logger, log_stats in log_queue_stats().items():
+            self.set('log_queue_depth', log_stats['queue_depth'], {'logger': logger})
+            # The dropped count of the process, a counter only growing
+            self.set('log_records_dropped_total', log_stats['dropped'], {'logger': logger})
+
+    def collect(self):
+        """
+        Merge the samples of every process store, returning
+        {metric name: {(sample name, labels): value}}
+        """
+        metrics = {}
+        paths = [(self._path(pid), _process_alive(pid)) for pid in self._pids()]
+        paths.append((os.path.join(self.directory, AGGREGATE_FILE), False))
+        for path, alive in paths:
+            try:
+                values = MmapedValues(path, read_only=True)
+            except (OSError, ValueError):
+                # The file of an exited process was just merged and removed,
+                # or there is no aggregate yet
+                continue
+            try:
+                items = values.items()
+            finally:
+                values.close()
+
+            for key, value in items:
+                sample, labels = json.loads(key)
+                name = _metric_name(sample)
+                if _metric_type(sample) == 'gauge' and not alive:
+                    continue
+                samples = metrics.setdefault(name, {})
+                sample_key = (sample, tuple(sorted(labels.items())))
+                samples[sample_key] = samples.get(sample_key, 0) + value
+        return metrics
+
+    def render(self):
+        """
+        Render the merged samples in the Prometheus text exposition format
+        """
+        lines = []
+        for name, samples in sorted(self.collect().items()):
+            kind, description = METRICS.get(name, ('untyped', name))
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {kind}')
+            if kind == 'histogram':
+                samples = _cumulative_buckets(samples)
+            for (sample, labels), value in sorted(samples.items(), key=_sample_order):
+                label_text = ','.join(f'{label}="{_escape(label_value)}"'
+                                      for label, label_value in labels)
+                lines.append(f'{sample}{{{label_text}}} {_format_value(value)}'
+                             if label_text else f'{sample} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+    def _scrape_allowed(self, remote_addr):
+        """
+        Check if a client address is in METRICS_ALLOWED_NETWORKS
+        """
+        try:
+            address = ipaddress.ip_address(remote_addr or '')
+        except ValueError:
+            return False
+        return any(address in network for network in self.allowed_networks)
+
+    def metrics_view(self):
+        """
+        Serve the metrics of all processes to the allowed networks
+        """
+        if not self._scrape_allowed(request.remote_addr):
+            return Response('Forbidden\n', status=403, mimetype='text/plain')
+        self._record_gauges()
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+
+def _metric_name(sample):
+    """
+    Return the metric of a sample name, such as the histogram of its buckets
+    """
+    return next((metric for metric in METRICS if sample == metric or
+                 sample.startswith(metric + '_')), sample)
+
+
+def _metric_type(sample):
+    """
+    Return the metric type of a sample name, unknown samples being gauges
+    """
+    return METRICS.get(_metric_name(sample), ('gauge',))[0]
+
+
+def _bucket_bound(labels):
+    """
+    Return the numeric upper bound of a bucket sample
+    """
+    bound = dict(labels).get('le')
+    return float('inf') if bound == '+Inf' else float(bound)
+
+
+def _sample_order(item):
+    """
+    Sort the samples by name, labels and bucket bound
+    """
+    (sample, labels), _ = item
+    others = tuple((label, value) for label, value in labels if label != 'le')
+    return (sample, others, _bucket_bound(labels) if sample.endswith('_bucket') else 0)
+
+
+def _cumulative_buckets(samples):
+    """
+    Turn the per bucket histogram counts into the cumulative counts of every
+    bound, +Inf included
+    """
+    result = {key: value for key, value in samples.items() if not key[0].endswith('_bucket')}
+    series = {}
+    for (sample, labels), value in samples.items():
+        if sample.endswith('_bucket'):
+            others = tuple((label, label_value) for label, label_value in labels if label != 'le')
+            series.setdefault((sample, others), {})[dict(labels)['le']] = value
+
+    for (sample, others), counts in series.items():
+        total = 0
+        for bound in [str(bound) for bound in LATENCY_BUCKETS] + ['+Inf']:
+            total += counts.get(bound, 0)
+            labels = tuple(sorted(others + (('le', bound),)))
+            result[(sample, labels)] = total
+    return result
+
+
+metrics = MetricsRegistry()
+
+# End of file
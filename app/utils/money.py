@@ -0,0 +1,147 @@
+"""
+Exact money amounts.
+
+Amounts are held as an integer number of cents, in Python as Money values
+and in the database as BIGINT columns of MoneyType, so sums are integer
+additions done by the database and never accumulate binary rounding errors.
+Input in major units (form data, CSV text, searched amounts) is parsed with
+Decimal and rounded half up to the cent.
+"""
+
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from functools import total_ordering
+from sqlalchemy import BigInteger
+from sqlalchemy.types import TypeDecorator
+
+# Largest number of cents a BIGINT column holds
+MAX_CENTS = 2 ** 63 - 1
+
+
+@total_ordering
+class Money:
+    """
+    Immutable amount of money as an integer number of cents
+    """
+    __slots__ = ('cents',)
+
+    def __init__(self, cents=0):
+        object.__setattr__(self, 'cents', int(cents))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Money is immutable')
+
+    def __reduce__(self):
+        return (Money, (self.cents,))
+
+    @classmethod
+    def parse(cls, value):
+        """
+        Return the Money of an amount in major units given as text, Decimal,
+        int or float, raising ValueError when it is not a number or does not
+        fit a BIGINT column of cents
+        """
+        if isinstance(value, Money):
+            return value
+        if isinstance(value, str):
+            value = value.strip().replace(',', '')
+        elif isinstance(value, float):
+            # repr is the shortest text of the float, 0.1 and not 0.1000000000000000055
+            value = repr(value)
+        try:
+            amount = Decimal(value)
+        except (InvalidOperation, TypeError, ValueError) as exc:
+            raise ValueError(f'invalid amount {value!r}') from exc
+        if not amount.is_finite():
+            raise ValueError(f'invalid amount {value!r}')
+        try:
+            cents = int((amount * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+        except InvalidOperation as exc:
+            raise ValueError(f'amount out of range {value!r}') from exc
+        if not -MAX_CENTS <= cents <= MAX_CENTS:
+            raise ValueError(f'amount out of range {value!r}')
+        return cls(cents)
+
+    @property
+    def amount(self):
+        """
+        Return the amount in major units as an exact Decimal
+        """
+        return Decimal(self.cents).scaleb(-2)
+
+    def __str__(self):
+        return format(self.amount, 'f')
+
+    def __repr__(self):
+        return f"Money('{self}')"
+
+    def __format__(self, spec):
+        return format(self.amount, spec)
+
+    def __float__(self):
+        return self.cents / 100
+
+    def __bool__(self):
+        return self.cents != 0
+
+    def __hash__(self):
+        return hash(self.cents)
+
+    def __eq__(self, other):
+        if isinstance(other, Money):
+            return self.cents == other.cents
+        return NotImplemented
+
+    def __lt__(self, other):
+        if isinstance(other, Money):
+            return self.cents < other.cents
+        return NotImplemented
+
+    def __add__(self, other):
+        if isinstance(other, Money):
+            return Money(self.cents + other.cents)
+        return NotImplemented
+
+    def __radd__(self, other):
+        # Lets sum() start from its integer 0
+        if other == 0:
+            return self
+        return NotImplemented
+
+    def __sub__(self, other):
+        if isinstance(other, Money):
+            return Money(self.cents - other.cents)
+        return NotImplemented
+
+    def __neg__(self):
+        return Money(-self.cents)
+
+    def __abs__(self):
+        return Money(abs(self.cents))
+
+
+class MoneyType(TypeDecorator):
+    """
+    BIGINT column of cents read and written as Money, plain numbers bound to
+    it (searched amounts, literals) are taken as major units
+    """
+    impl = BigInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return Money.parse(value).cents
+
+    def process_literal_param(self, value, dialect):
+        return str(self.process_bind_param(value, dialect))
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return Money(value)
+
+    @property
+    def python_type(self):
+        return Money
+
+# End of file
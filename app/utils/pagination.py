@@ -0,0 +1,164 @@
+"""
+Pagination utilities shared by the listing views
+"""
+
+import json
+import base64
+import binascii
+from datetime import date, datetime
+from enum import Enum
+from flask import request
+from sqlalchemy import and_, case, or_
+from sqlalchemy.sql import desc, asc
+from app.utils.money import Money
+
+
+class KeysetPage:
+    """
+    A page of results fetched by seeking past a cursor instead of an OFFSET
+    """
+    def __init__(self, items, per_page, next_cursor, cursor):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.cursor = cursor
+        self.has_next = next_cursor is not None
+        self.has_prev = bool(cursor)
+        self.keyset = True
+
+    def __iter__(self):
+        return iter(self.items)
+
+
+def _encode_value(value):
+    """
+    A function to make a sort value JSON serializable
+    """
+    if isinstance(value, Enum):
+        return value.name
+    if isinstance(value, Money):
+        return value.cents
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _decode_value(column, value):
+    """
+    A function to restore a sort value to the python type of its column
+    """
+    if value is None:
+        return None
+    enum_class = getattr(column.type, 'enum_class', None)
+    if enum_class is not None:
+        return enum_class[value]
+    python_type = column.type.python_type
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is date:
+        return date.fromisoformat(value)
+    return python_type(value)
+
+
+def encode_cursor(sort_value, id_value):
+    """
+    Encode the sort and id values of the last row into an opaque cursor
+    """
+    payload = json.dumps([_encode_value(sort_value), id_value], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, sort_column):
+    """
+    Decode an opaque cursor, returning None if it is empty or malformed
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_value, id_value = json.loads(base64.urlsafe_b64decode(padded))
+        return _decode_value(sort_column, sort_value), id_value
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        return None
+
+
+def _nullable(column):
+    """
+    Check if a sort column can be NULL, expressions such as a computed rank
+    have no nullable flag and are treated as nullable
+    """
+    return getattr(column, 'nullable', True)
+
+
+def _seek_filter(sort_column, id_column, descending, sort_value, id_value):
+    """
+    Build the predicate selecting the rows after (sort_value, id_value), rows
+    with a NULL sort value are always ordered last
+    """
+    after = (lambda column, value: column < value) if descending \
+        else (lambda column, value: column > value)
+
+    if sort_value is None:
+        return and_(sort_column.is_(None), after(id_column, id_value))
+
+    seek = or_(after(sort_column, sort_value),
+               and_(sort_column == sort_value, after(id_column, id_value)))
+    if _nullable(sort_column):
+        seek = or_(seek, sort_column.is_(None))
+    return seek
+
+
+def _ordering(sort_column, id_column, descending):
+    """
+    Build the ORDER BY clauses of a (sort_column, id) listing
+    """
+    direction = desc if descending else asc
+    ordering = [direction(sort_column), direction(id_column)]
+    if _nullable(sort_column):
+        ordering.insert(0, case((sort_column.is_(None), 1), else_=0))
+    return ordering
+
+
+def order_listing(query, sort_column, sort_order, id_column):
+    """
+    Order a listing query by (sort_column, id) the way the listing pages are
+    """
+    descending = sort_order == 'desc'
+    return query.order_by(None).order_by(*_ordering(sort_column, id_column, descending))
+
+
+def paginate_listing(query, sort_column, sort_order, id_column, page, per_page, total=None):
+    """
+    Paginate a listing query ordered by (sort_column, id).
+
+    The default mode is the usual page number pagination. When the request
+    carries an `after` argument (an empty value starts at the first row) the
+    query seeks past the cursor instead, which avoids the OFFSET scan and the
+    COUNT(*) query, and a KeysetPage is returned. A known total, such as the
+    cached row count of an unfiltered listing, saves the pagination count.
+    """
+    descending = sort_order == 'desc'
+    query = order_listing(query, sort_column, sort_order, id_column)
+
+    if 'after' not in request.args:
+        if total is None:
+            return query.paginate(page=page, per_page=per_page)
+        pagination = query.paginate(page=page, per_page=per_page, count=False)
+        pagination.total = total
+        return pagination
+
+    cursor = request.args.get('after', '')
+    position = decode_cursor(cursor, sort_column)
+    if position is not None:
+        query = query.filter(_seek_filter(sort_column, id_column, descending, *position))
+
+    rows = query.limit(per_page + 1).all()
+    items = rows[:per_page]
+    next_cursor = None
+    if len(rows) > per_page:
+        last = items[-1]
+        next_cursor = encode_cursor(getattr(last, sort_column.key), getattr(last, id_column.key))
+
+    return KeysetPage(items, per_page, next_cursor, cursor if position else None)
+
+# End of file
@@ -0,0 +1,91 @@
+"""
+Date period utilities for building index friendly date range queries
+"""
+
+from datetime import date, datetime, timedelta
+from sqlalchemy import and_
+
+PERIODS = ('week', 'month', 'quarter', 'year')
+
+
+def _as_date(value):
+    """
+    A function to normalise a datetime or date value to a date
+    """
+    if value is None:
+        return datetime.now().date()
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+
+def week_range(value=None):
+    """
+    Return the half-open [monday, next monday) range containing the date
+    """
+    start = _as_date(value)
+    start = start - timedelta(days=start.weekday())
+    return start, start + timedelta(days=7)
+
+
+def month_range(value=None):
+    """
+    Return the half-open [first of month, first of next month) range
+    """
+    start = _as_date(value).replace(day=1)
+    if start.month == 12:
+        return start, date(start.year + 1, 1, 1)
+    return start, date(start.year, start.month + 1, 1)
+
+
+def quarter_range(value=None):
+    """
+    Return the half-open [first of quarter, first of next quarter) range
+    """
+    value = _as_date(value)
+    start = date(value.year, 3 * ((value.month - 1) // 3) + 1, 1)
+    if start.month == 10:
+        return start, date(start.year + 1, 1, 1)
+    return start, date(start.year, start.month + 3, 1)
+
+
+def year_range(value=None):
+    """
+    Return the half-open [first of year, first of next year) range
+    """
+    value = _as_date(value)
+    return date(value.year, 1, 1), date(value.year + 1, 1, 1)
+
+
+def custom_range(start, end):
+    """
+    Return the half-open range for an inclusive start and end date
+    """
+    start, end = _as_date(start), _as_date(end)
+    if end < start:
+        raise ValueError('The period end date cannot be before the start date')
+    return start, end + timedelta(days=1)
+
+
+def period_range(period, value=None):
+    """
+    Return the half-open range for a named period containing the date
+    """
+    ranges = {
+        'week': week_range,
+        'month': month_range,
+        'quarter': quarter_range,
+        'year': year_range
+    }
+    if period not in ranges:
+        raise ValueError(f'Unknown period {period!r}, expected one of {", ".join(PERIODS)}')
+    return ranges[period](value)
+
+
+def in_range(column, start, end):
+    """
+    Build a sargable `start <= column < end` predicate for a date column
+    """
+    return and_(column >= start, column < end)
+
+# End of file
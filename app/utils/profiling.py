@@ -0,0 +1,164 @@
+"""
+Per-request SQL profiling.
+
+Cursor execution events time every statement. Within a request the query
+count, total database time and slowest statements are collected on g for the
+completion log line and the Server-Timing header, and so is the template
+render time. The render listeners also record the template being rendered,
+which the N+1 query guard reports. Statements slower than SLOW_QUERY_MS are
+written with their EXPLAIN plan to the slow query log, and their parameters
+when SLOW_QUERY_LOG_PARAMETERS is set.
+"""
+
+import time
+import heapq
+from flask import before_render_template, current_app, g, has_app_context
+from flask import has_request_context, template_rendered
+from sqlalchemy import event
+from app.extensions import db
+
+
+def init_sql_profiler(app):
+    """
+    A function to register the statement timing and template render listeners
+    """
+    if not app.config['SQL_PROFILING']:
+        return
+
+    with app.app_context():
+        engine = db.engine
+    if not event.contains(engine, 'before_cursor_execute', _before_execute):
+        event.listen(engine, 'before_cursor_execute', _before_execute)
+        event.listen(engine, 'after_cursor_execute', _after_execute)
+
+    init_render_signals(app)
+
+
+def init_render_signals(app):
+    """
+    A function to register the template render listeners, shared by the SQL
+    profiler and the query guard
+    """
+    before_render_template.connect(_render_started, app)
+    template_rendered.connect(_render_finished, app)
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    """
+    Record the start time of a statement on its execution context
+    """
+    if context is not None:
+        context.profile_start_time = time.perf_counter()
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    """
+    Add the statement time to the request profile and log it if slow
+    """
+    start = getattr(context, 'profile_start_time', None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+
+    if has_request_context():
+        profile = request_profile()
+        profile['count'] += 1
+        profile['db_time'] += elapsed
+        entry = (elapsed, profile['count'], statement)
+        if len(profile['slowest']) < current_app.config['SQL_PROFILE_SLOWEST']:
+            heapq.heappush(profile['slowest'], entry)
+        else:
+            heapq.heappushpop(profile['slowest'], entry)
+
+    if not has_app_context() or elapsed * 1000 < current_app.config['SLOW_QUERY_MS']:
+        return
+
+    request_id = g.get('request_id', 'no_request_id') if has_request_context() else 'background'
+    plan = None if executemany else explain(cursor, conn.dialect.name, statement, parameters)
+    # The parameters of writes hold password hashes and secrets
+    shown = repr(parameters) if current_app.config['SLOW_QUERY_LOG_PARAMETERS'] else 'not logged'
+    current_app.slow_query_logger.warning(
+        "[%s] %.4fs %s\nParameters: %s\nPlan:\n%s", request_id, elapsed,
+        statement, shown, plan or 'not available')
+
+
+def explain(cursor, dialect, statement, parameters):
+    """
+    Return the plan of a SELECT statement run on the connection of its cursor,
+    None for other statements or when the plan cannot be read
+    """
+    if not statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+        return None
+
+    prefix = 'EXPLAIN QUERY PLAN ' if dialect == 'sqlite' else 'EXPLAIN '
+    # A failed statement aborts the whole PostgreSQL transaction of the
+    # request, the plan is read in a savepoint rolled back on failure
+    savepoint = dialect == 'postgresql'
+    try:
+        explain_cursor = cursor.connection.cursor()
+        try:
+            if savepoint:
+                explain_cursor.execute('SAVEPOINT slow_query_explain')
+            try:
+                explain_cursor.execute(prefix + statement, parameters)
+                rows = explain_cursor.fetchall()
+            except Exception:
+                if savepoint:
+                    explain_cursor.execute('ROLLBACK TO SAVEPOINT slow_query_explain')
+                raise
+            if savepoint:
+                explain_cursor.execute('RELEASE SAVEPOINT slow_query_explain')
+        finally:
+            explain_cursor.close()
+    except Exception:  # pylint: disable=broad-except
+        # The plan is a diagnostic, never fail the profiled statement
+        return None
+    return '\n'.join(' '.join(str(value) for value in row) for row in rows)
+
+
+def _render_started(sender, template, context, **extra):
+    """
+    Record the template being rendered and its start time
+    """
+    g.rendering_template = template.name
+    g.render_start_time = time.perf_counter()
+
+
+def _render_finished(sender, template, context, **extra):
+    """
+    Forget the rendered template and add its render time to the request
+    profile when profiling
+    """
+    g.pop('rendering_template', None)
+    start = g.pop('render_start_time', None)
+    if start is not None and sender.config['SQL_PROFILING']:
+        request_profile()['render_time'] += time.perf_counter() - start
+
+
+def request_profile():
+    """
+    Return the SQL and render profile of the current request
+    """
+    if 'sql_profile' not in g:
+        g.sql_profile = {'count': 0, 'db_time': 0.0, 'render_time': 0.0, 'slowest': []}
+    return g.sql_profile
+
+
+def slowest_statements(profile):
+    """
+    Return the (seconds, statement) of the slowest statements, slowest first,
+    with the statements collapsed to one line
+    """
+    return [(elapsed, ' '.join(statement.split()))
+            for elapsed, _, statement in sorted(profile['slowest'], reverse=True)]
+
+
+def server_timing(profile, total):
+    """
+    Build the Server-Timing header value of a request profile
+    """
+    return (f'db;dur={profile["db_time"] * 1000:.1f};desc="{profile["count"]} queries", '
+            f'render;dur={profile["render_time"] * 1000:.1f}, '
+            f'total;dur={total * 1000:.1f}')
+
+# End of file
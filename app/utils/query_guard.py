@@ -0,0 +1,88 @@
+"""
+N+1 query detection for the development and testing configurations.
+
+The guard counts the SQL statements of each request and the lazy loads of each
+relationship. A relationship lazy loaded more than QUERY_GUARD_LAZY_LIMIT times
+in a request, typically from a template loop over a listing, is logged in
+'log' mode and raises NPlusOneError in 'raise' mode.
+"""
+
+from collections import Counter
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app.extensions import db
+from app.utils.profiling import init_render_signals
+
+
+class NPlusOneError(RuntimeError):
+    """
+    Raised in 'raise' mode when a relationship is lazy loaded repeatedly
+    """
+
+
+def init_query_guard(app):
+    """
+    A function to register the statement and lazy load counters when the
+    QUERY_GUARD mode is set
+    """
+    if not app.config['QUERY_GUARD']:
+        return
+
+    with app.app_context():
+        engine = db.engine
+    if not event.contains(engine, 'before_cursor_execute', _count_statement):
+        event.listen(engine, 'before_cursor_execute', _count_statement)
+    if not event.contains(Session, 'do_orm_execute', _check_lazy_load):
+        event.listen(Session, 'do_orm_execute', _check_lazy_load)
+
+    init_render_signals(app)
+    app.after_request(_report_statements)
+
+
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    """
+    Count a statement executed by the current request
+    """
+    if has_request_context():
+        g.sql_statements = g.get('sql_statements', 0) + 1
+
+
+def _check_lazy_load(orm_execute_state):
+    """
+    Count the lazy loads of each relationship and report the first one going
+    over the limit
+    """
+    if not orm_execute_state.is_relationship_load or not has_request_context():
+        return
+    app = current_app._get_current_object()
+    if not app.config['QUERY_GUARD']:
+        return
+
+    relationship = str(orm_execute_state.loader_strategy_path[-1])
+    lazy_loads = g.setdefault('lazy_loads', Counter())
+    lazy_loads[relationship] += 1
+    if lazy_loads[relationship] != app.config['QUERY_GUARD_LAZY_LIMIT'] + 1:
+        return
+
+    template = g.get('rendering_template')
+    message = (f"[{g.get('request_id', 'no_request_id')}] N+1 query: {relationship} "
+               f"lazy loaded {lazy_loads[relationship]} times by {request.endpoint}"
+               + (f" while rendering {template}" if template else ''))
+    if app.config['QUERY_GUARD'] == 'raise':
+        raise NPlusOneError(message)
+    app.logger.warning(message)
+
+
+def _report_statements(response):
+    """
+    Log the requests running more statements than QUERY_GUARD_MAX_STATEMENTS
+    """
+    statements = g.get('sql_statements', 0)
+    if statements > current_app.config['QUERY_GUARD_MAX_STATEMENTS']:
+        current_app.logger.warning("[%s] %s %s ran %d SQL statements",
+                                   g.get('request_id', 'no_request_id'),
+                                   request.method, request.path, statements)
+    return response
+
+# End of file
@@ -4,12 +4,15 @@ User configuration file that contains user views and routes.
 
 from flask import (Blueprint, current_app, flash, redirect, render_template, request, url_for)
 from flask_login import login_required, current_user
-from sqlalchemy.sql import desc, asc
 from app.extensions import db
 from app.models.user import User
 from app.models.role import Role
 from app.forms.user import UserDetailsForm, UserUpdateForm
 from app.forms.auth import AdminRegistrationForm, ChangePasswordForm
+from app.services.counters import row_count
+from app.services.identity import identity_cache
+from app.services.reference import currency_choices, role_choices
+from app.utils.pagination import paginate_listing
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admins')
 
@@ -39,7 +42,7 @@ def index():
     # Build query
     query = User.query
 
-    count_users = User.query.count()
+    count_users = row_count(User)
 
     # searching
     if search:
@@ -49,15 +52,10 @@ def index():
         )
         query = query.join(Role).filter(search_filter)
 
-    # Sorting
-    sort_column = allowed_sort_fields[sort_by]
-    if sort_order == 'desc':
-        query = query.order_by(desc(sort_column))
-    else:
-        query = query.order_by(asc(sort_column))
-
-    users = query.order_by(User.created_at.desc()).paginate(page=page,
-                                                            per_page=page_size)
+    # Sorting and pagination, page numbers or a cursor when ?after= is given
+    users = paginate_listing(query, allowed_sort_fields[sort_by], sort_order,
+                             User.id, page, page_size,
+                             total=None if search else count_users)
 
     if not users.items:
         flash('No user records added Yet!', 'warning')
@@ -103,8 +101,7 @@ def create():
     Add New User View
     """
     form = AdminRegistrationForm()
-    form.role.choices = [('', 'Select Role')] + [(r.id, r.name)
-                                                 for r in Role.query.all()]
+    form.role.choices = [('', 'Select Role')] + role_choices()
 
     if request.method == 'POST':
         firstname = form.firstname.data
@@ -165,6 +162,7 @@ def update(user_id):
     """
     item = User.query.get_or_404(user_id)
     form = UserUpdateForm(obj=item)
+    form.currency.choices = currency_choices()
 
     if item.username == 'superadmin':
         flash('The Super User cannot be edited!', 'danger')
@@ -176,6 +174,7 @@ def update(user_id):
         item.fullname = form.firstname.data + " " + form.lastname.data
         item.phone = form.phone.data
         item.email = form.email.data
+        item.currency = form.currency.data
         item.updated_by = current_user.id
 
         error = None
@@ -185,6 +184,7 @@ def update(user_id):
         else:
             try:
                 db.session.commit()
+                identity_cache.bump(user_id)
                 flash('User is updated successfully!', 'success')
                 return redirect(url_for('user.index'))
             except ImportError:
@@ -226,6 +226,7 @@ def changepassword(user_id):
             try:
                 item.set_password(form.new_password.data)
                 db.session.commit()
+                identity_cache.bump(user_id)
 
                 # Log the password change
                 current_app.logger.info(f"Password changed for user {item.username} "
@@ -262,8 +263,8 @@ def delete(user_id):
     """
     item = User.query.get_or_404(user_id)
     form = UserDetailsForm(obj=item)
-    form.role.choices = [(r.id, r.name)
-                         for r in Role.query.filter(Role.id == item.role_id).first()]
+    form.role.choices = [(role_id, name) for role_id, name in role_choices()
+                         if role_id == item.role_id]
 
     if item.username == 'SUPERADMIN':
         flash('The super user cannot be deleted!', 'danger')
@@ -273,6 +274,7 @@ def delete(user_id):
         try:
             db.session.delete(item)
             db.session.commit()
+            identity_cache.bump(user_id)
             flash('User is deleted successfully!', 'success')
             return redirect(url_for('user.index'))
         except ImportError:
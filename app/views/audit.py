@@ -4,9 +4,11 @@ Audit Log routes and views configuration file
 
 from flask import Blueprint, flash, render_template, request
 from flask_login import login_required
-from sqlalchemy.sql import desc, asc
 from app.models.auditlog import Auditlog
-from app.models.user import User
+from app.services.audit_archive import hot_window_filter
+from app.services.audit_search import search_audit_logs
+from app.services.counters import row_count
+from app.utils.pagination import paginate_listing
 
 auditlog_bp = Blueprint('auditlog', __name__, url_prefix='/auditlogs')
 
@@ -21,7 +23,8 @@ def index():
     page_size = request.args.get('page_size', 25, type=int)
 
     search = request.args.get('search', '')
-    sort_by = request.args.get('sort_by', 'created_at')  # Default sorting by created_at
+    # Default sorting by created_at, or by rank of the full-text matches of a search
+    sort_by = request.args.get('sort_by', 'rank' if search else 'created_at')
     sort_order = request.args.get('sort_order', 'desc')  # Default sorting order is descending
 
     allowed_sort_fields = {
@@ -33,32 +36,27 @@ def index():
         'created_at': Auditlog.created_at
     }
 
-    if sort_by not in allowed_sort_fields:
-        sort_by = 'created_at'
-
-    # Build query
-    query = Auditlog.query
+    # Build query, limited to the retention window so cold partitions are pruned
+    window = hot_window_filter()
+    query = Auditlog.query.filter(window)
 
-    auditlogs_count = Auditlog.query.count() or 0
+    # Counted with the same filter so the page count matches the listing, by
+    # the auditlogs strategy, a planner estimate where the database has one
+    auditlogs_count = row_count(Auditlog, window, key='hot-window')
 
-    # searching
+    # searching, full-text ranked within the window when the search index is installed
     if search:
-        search_filter = (
-            User.username.ilike(f'%{search}%') |
-            Auditlog.action.ilike(f'%{search}%') |
-            Auditlog.resource_type.ilike(f'%{search}%') |
-            Auditlog.user_agent.ilike(f'%{search}%')
-        )
-        query = query.join(User).filter(search_filter)
+        query, rank = search_audit_logs(query, search, window)
+        if rank is not None:
+            allowed_sort_fields['rank'] = rank
 
-    # Sorting
-    sort_column = allowed_sort_fields[sort_by]
-    if sort_order == 'desc':
-        query = query.order_by(desc(sort_column))
-    else:
-        query = query.order_by(asc(sort_column))
+    if sort_by not in allowed_sort_fields:
+        sort_by = 'created_at'
 
-    auditlogs = query.order_by(Auditlog.created_at.desc()).paginate(page=page, per_page=page_size)
+    # Sorting and pagination, page numbers or a cursor when ?after= is given
+    auditlogs = paginate_listing(query, allowed_sort_fields[sort_by], sort_order,
+                                 Auditlog.id, page, page_size,
+                                 total=None if search else auditlogs_count)
 
     if not auditlogs.items:
         flash('No audit logs records added Yet!', 'warning')
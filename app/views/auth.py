@@ -15,6 +15,7 @@ from werkzeug.security import check_password_hash
 from app.models.user import User
 from app.forms.auth import LoginForm, TwoFactorForm
 from app.extensions import db
+from app.services.identity import identity_cache
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/auth')
 
@@ -100,6 +101,7 @@ def enable_2fa():
             current_user.two_factor_secret = secret
             current_user.is_2fa_enabled = True
             db.session.commit()
+            identity_cache.bump(current_user.id)
 
             # Clear the temporary secret from session
             session.pop('temp_2fa_secret', None)
@@ -120,6 +122,7 @@ def disable_2fa():
     current_user.is_2fa_enabled = False
     current_user.two_factor_secret = None
     db.session.commit()
+    identity_cache.bump(current_user.id)
 
     flash('Two-factor authentication has been disabled.', 'success')
     return redirect(url_for('profile.about'))
@@ -3,13 +3,17 @@ Admin configuration file that contains admin views and routes.
 """
 
 import calendar
-from datetime import datetime
-from flask import Blueprint, render_template
+from datetime import date, datetime, timedelta
+from flask import Blueprint, current_app, jsonify, render_template, request
 from flask_login import login_required, current_user
-from sqlalchemy import func, extract
-from app.extensions import db
+from sqlalchemy.orm import joinedload
 # from app.models.category import Category
-from app.models.transaction import Transaction, TType
+from app.models.transaction import Transaction
+from app.services.analytics import load_columns, spending_report
+from app.services.cashflow import BUCKETS, cashflow_etag, cashflow_series, choose_bucket
+from app.services.exchange import convert
+from app.services.summary import summarize_period
+from app.utils.periods import custom_range, month_range
 
 base_bp = Blueprint('base', __name__, url_prefix='/app')
 
@@ -22,36 +26,90 @@ def dashboard():
     """
     # Get recent transactions
     recent_transactions = Transaction.query.filter_by(user_id=current_user.id)\
+        .options(joinedload(Transaction.category))\
         .order_by(Transaction.date.desc()).limit(5).all()
 
     # Calculate current month totals
     current_month = datetime.now().month
-    current_year = datetime.now().year
-
-    monthly_income = db.session.query(func.sum(Transaction.amount)).filter(
-        Transaction.transaction_type == TType.INCOME,
-        extract('month', Transaction.date) == current_month,
-        extract('year', Transaction.date) == current_year,
-        Transaction.user_id == current_user.id
-    ).scalar() or 0
-
-    monthly_expenses = db.session.query(func.sum(Transaction.amount)).filter(
-        Transaction.transaction_type == TType.EXPENSE,
-        extract('month', Transaction.date) == current_month,
-        extract('year', Transaction.date) == current_year,
-        Transaction.user_id == current_user.id
-    ).scalar() or 0
-
-    balance = monthly_income - monthly_expenses
+    currency = current_user.currency
+    summary = summarize_period(current_user.id, *month_range(), currency)
 
+    # Base currency values of the foreign recent transactions, from the rate cache
+    converted = {transaction.id: convert(transaction.amount, transaction.currency,
+                                         currency, transaction.date)
+                 if transaction.currency != currency else None
+                 for transaction in recent_transactions}
 
     return render_template('dashboard.html',
                            title='Dashboard',
                            recent_transactions=recent_transactions,
-                           monthly_income=monthly_income,
-                           monthly_expenses=monthly_expenses,
-                           balance=balance,
+                           converted=converted,
+                           currency=currency,
+                           unconverted=summary['unconverted'],
+                           monthly_income=summary['income'],
+                           monthly_expenses=summary['expenses'],
+                           monthly_count=summary['count'],
+                           balance=summary['balance'],
                            current_month=calendar.month_name[current_month],
                            DASHBOARD=True)
 
+
+@base_bp.route('/reports/')
+@login_required
+def reports():
+    """
+    Spending reports view, the same report is returned as JSON with ?format=json
+    """
+    columns = load_columns(current_user.id, current_user.currency)
+    report = spending_report(columns,
+                             current_app.config['ANALYTICS_ROLLING_WINDOWS'],
+                             current_app.config['ANALYTICS_PERCENTILES'])
+    if request.args.get('format') == 'json':
+        return jsonify(report)
+
+    return render_template('reports.html',
+                           title='Reports',
+                           report=report,
+                           months=current_app.config['REPORT_MONTHS'],
+                           REPORTS=True)
+
+
+@base_bp.route('/api/cashflow')
+@login_required
+def cashflow():
+    """
+    Cash-flow series of the user as JSON for the dashboard chart, answered
+    with 304 Not Modified while the ETag of the series is current
+    """
+    requested = request.args.get('bucket', 'day')
+    if requested not in BUCKETS:
+        return jsonify(error=f'Unknown bucket {requested}, expected one of '
+                             f'{", ".join(BUCKETS)}'), 400
+    try:
+        end = date.fromisoformat(request.args['to']) if request.args.get('to') \
+            else datetime.now().date()
+        start = date.fromisoformat(request.args['from']) if request.args.get('from') \
+            else end - timedelta(days=current_app.config['CASHFLOW_DEFAULT_DAYS'] - 1)
+        start, end = custom_range(start, end)
+        bucket = choose_bucket(start, end, requested, current_app.config['CASHFLOW_MAX_POINTS'])
+    except OverflowError:
+        return jsonify(error='The range ends after the last supported date'), 400
+    except ValueError as exc:
+        return jsonify(error=str(exc)), 400
+
+    currency = current_user.currency
+    etag = cashflow_etag(current_user.id, currency, start, end, bucket)
+    if etag in request.if_none_match:
+        response = current_app.response_class(status=304)
+    else:
+        series = cashflow_series(current_user.id, start, end, bucket, currency)
+        series['requested_bucket'] = requested
+        response = jsonify(series)
+
+    response.set_etag(etag)
+    # Cached by the browser only, and revalidated with the ETag on every load
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
 # End of file
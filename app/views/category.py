@@ -4,10 +4,12 @@ Category routes and views configuration file
 
 from flask import Blueprint, flash, redirect, render_template, request, url_for
 from flask_login import login_required, current_user
-from sqlalchemy.sql import desc, asc
 from app.extensions import db
 from app.models.category import Category
 from app.forms.category import CatgoryForm, CatgoryDetailsForm
+from app.services.counters import row_count
+from app.services.reference import invalidate_reference
+from app.utils.pagination import paginate_listing
 
 category_bp = Blueprint('category', __name__, url_prefix='/categories')
 
@@ -39,7 +41,7 @@ def index():
     # Build query
     query = Category.query
 
-    count_categories = Category.query.count()
+    count_categories = row_count(Category)
 
     # searching
     if search:
@@ -48,15 +50,10 @@ def index():
         )
         query = query.filter(search_filter)
 
-    # Sorting
-    sort_column = allowed_sort_fields[sort_by]
-    if sort_order == 'desc':
-        query = query.order_by(desc(sort_column))
-    else:
-        query = query.order_by(asc(sort_column))
-
-    categories = query.order_by(Category.created_at.desc()).paginate(page=page,
-                                                                     per_page=page_size)
+    # Sorting and pagination, page numbers or a cursor when ?after= is given
+    categories = paginate_listing(query, allowed_sort_fields[sort_by], sort_order,
+                                  Category.id, page, page_size,
+                                  total=None if search else count_categories)
 
     if not categories.items:
         flash('No category records added Yet!', 'warning')
@@ -100,6 +97,7 @@ def create():
                                         user_id=current_user.id)
                 db.session.add(new_category)
                 db.session.commit()
+                invalidate_reference('categories')
                 flash(f'{name} is created successfully!', 'success')
                 return redirect(url_for('category.index'))
             except ImportError:
@@ -142,6 +140,7 @@ def update(category_id):
         else:
             try:
                 db.session.commit()
+                invalidate_reference('categories')
                 flash(f'{item.name} is updated successfully!', 'success')
                 return redirect(url_for('category.index'))
             except ImportError:
@@ -170,6 +169,7 @@ def delete(category_id):
         try:
             db.session.delete(item)
             db.session.commit()
+            invalidate_reference('categories')
             flash('Category is deleted successfully!', 'success')
             return redirect(url_for('category.index'))
         except ImportError:
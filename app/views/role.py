@@ -4,10 +4,13 @@ Role routes and views configuration file
 
 from flask import Blueprint, flash, redirect, render_template, request, url_for
 from flask_login import login_required, current_user
-from sqlalchemy.sql import desc, asc
 from app.extensions import db
 from app.models.role import Role
 from app.forms.role import RoleForm
+from app.services.counters import row_count
+from app.services.identity import identity_cache
+from app.services.reference import invalidate_reference
+from app.utils.pagination import paginate_listing
 # from app.decorators.auth import require_permission
 # from app.utils.audit import audit_trail
 
@@ -42,7 +45,7 @@ def index():
     # Build query
     query = Role.query
 
-    count_roles = Role.query.count()
+    count_roles = row_count(Role)
 
     # searching
     if search:
@@ -51,15 +54,10 @@ def index():
         )
         query = query.filter(search_filter)
 
-    # Sorting
-    sort_column = allowed_sort_fields[sort_by]
-    if sort_order == 'desc':
-        query = query.order_by(desc(sort_column))
-    else:
-        query = query.order_by(asc(sort_column))
-
-    roles = query.order_by(Role.created_at.desc()).paginate(page=page,
-                                                            per_page=page_size)
+    # Sorting and pagination, page numbers or a cursor when ?after= is given
+    roles = paginate_listing(query, allowed_sort_fields[sort_by], sort_order,
+                             Role.id, page, page_size,
+                             total=None if search else count_roles)
 
     if not roles.items:
         flash('No role records added Yet!', 'warning')
@@ -101,6 +99,7 @@ def create():
                                 updated_by=current_user.id)
                 db.session.add(new_role)
                 db.session.commit()
+                invalidate_reference('roles')
                 flash(f'{name} is created successfully!', 'success')
                 return redirect(url_for('role.index'))
             except ImportError:
@@ -147,6 +146,8 @@ def update(role_id):
         else:
             try:
                 db.session.commit()
+                invalidate_reference('roles')
+                identity_cache.bump_roles()
                 flash(f'{item.name} is updated successfully!', 'success')
                 return redirect(url_for('role.index'))
             except ImportError:
@@ -180,6 +181,8 @@ def delete(role_id):
         try:
             db.session.delete(item)
             db.session.commit()
+            invalidate_reference('roles')
+            identity_cache.bump_roles()
             flash('Role is deleted successfully!', 'success')
             return redirect(url_for('role.index'))
         except ImportError:
@@ -2,16 +2,34 @@
 Transaction routes and views configuration file
 """
 
-from flask import Blueprint, flash, redirect, render_template, request, url_for
+import io
+import os
+from datetime import datetime
+from flask import Blueprint, Response, abort, current_app, flash, redirect, render_template
+from flask import request, send_from_directory, stream_with_context, url_for
 from flask_login import login_required, current_user
-from sqlalchemy.sql import desc, asc
+from sqlalchemy.orm import joinedload
 from app.extensions import db
-from app.models.category import Category
 from app.models.transaction import Transaction
-from app.forms.transaction import TransactionForm, TransactionDetailsForm
+from app.forms.transaction import TransactionForm, TransactionDetailsForm, TransactionImportForm
+from app.services.counters import row_count
+from app.services.reference import category_choices, currency_choices
+from app.services.transaction_export import (EXPORT_FORMATS, export_chunks, export_query,
+                                             gzip_chunks)
+from app.services.transaction_import import import_transactions
+from app.services.transaction_search import search_transactions
+from app.utils.audit import log_audit
+from app.utils.pagination import order_listing, paginate_listing
 
 transaction_bp = Blueprint('transaction', __name__, url_prefix='/transactions')
 
+SORT_FIELDS = {
+    'category': Transaction.category_id,
+    'amount': Transaction.amount,
+    'type': Transaction.transaction_type,
+    'created_at': Transaction.created_at
+}
+
 
 @transaction_bp.route('/index/')
 @login_required
@@ -22,8 +40,10 @@ def index():
     Render Transactions page with search, sort and pagination
     """
     form = TransactionForm()
-    form.category.choices = [('', 'Select Category')] + [(c.id, c.name)
-                                                         for c in Category.query.all()]
+    form.category.choices = [('', 'Select Category')] + category_choices()
+    form.currency.choices = currency_choices()
+    if not form.currency.data:
+        form.currency.data = current_user.currency
 
     page = request.args.get('page', 1, type=int)
     page_size = request.args.get('page_size', 15, type=int)
@@ -32,38 +52,22 @@ def index():
     sort_by = request.args.get('sort_by', 'created_at')  # Default sorting by created_at
     sort_order = request.args.get('sort_order', 'desc')  # Default sorting order is descending
 
-    allowed_sort_fields = {
-        'category': Transaction.category_id,
-        'amount': Transaction.amount,
-        'type': Transaction.transaction_type,
-        'created_at': Transaction.created_at
-    }
-
-    if sort_by not in allowed_sort_fields:
+    if sort_by not in SORT_FIELDS:
         sort_by = 'created_at'
 
-    # Build query
-    query = Transaction.query
+    # Build query, the listing renders the category name of every row
+    query = Transaction.query.options(joinedload(Transaction.category))
 
-    count_transactions = Transaction.query.count()
+    count_transactions = row_count(Transaction)
 
-    # searching
+    # searching, description and category text with amount exact or range tokens
     if search:
-        search_filter = (
-            Category.name.ilike(f'%{search}%') |
-            Transaction.amount.ilike(f'%{search}%')
-        )
-        query = query.join(Category).filter(search_filter)
-
-    # Sorting
-    sort_column = allowed_sort_fields[sort_by]
-    if sort_order == 'desc':
-        query = query.order_by(desc(sort_column))
-    else:
-        query = query.order_by(asc(sort_column))
-
-    transactions = query.order_by(Transaction.created_at.desc()).paginate(page=page,
-                                                                          per_page=page_size)
+        query = search_transactions(query, search)
+
+    # Sorting and pagination, page numbers or a cursor when ?after= is given
+    transactions = paginate_listing(query, SORT_FIELDS[sort_by], sort_order,
+                                    Transaction.id, page, page_size,
+                                    total=None if search else count_transactions)
 
     if not transactions.items:
         flash('No transaction records added Yet!', 'warning')
@@ -80,6 +84,105 @@ def index():
 
 
 
+@transaction_bp.route('/export/')
+@login_required
+def export():
+    """
+    Stream the transactions matching the listing search and sort as a CSV or
+    JSON Lines download, gzip compressed when ?gzip=1 is given
+    """
+    export_format = request.args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        flash(f'Unknown export format {export_format}!', 'danger')
+        return redirect(url_for('transaction.index'))
+
+    search = request.args.get('search', '')
+    sort_by = request.args.get('sort_by', 'created_at')
+    sort_order = request.args.get('sort_order', 'desc')
+    if sort_by not in SORT_FIELDS:
+        sort_by = 'created_at'
+
+    query = export_query()
+    if search:
+        query = search_transactions(query, search)
+    query = order_listing(query, SORT_FIELDS[sort_by], sort_order, Transaction.id)
+
+    chunks = export_chunks(query, export_format, current_app.config['EXPORT_BATCH_SIZE'])
+    filename = f"transactions-{datetime.now():%Y%m%d-%H%M%S}.{export_format}"
+    mimetype = EXPORT_FORMATS[export_format]
+    if request.args.get('gzip', type=int):
+        chunks = gzip_chunks(chunks)
+        filename += '.gz'
+        mimetype = 'application/gzip'
+
+    return Response(stream_with_context(chunks), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"',
+                             'X-Accel-Buffering': 'no'})
+
+
+
+@transaction_bp.route('/import/', methods=['GET', 'POST'])
+@login_required
+def import_file():
+    """
+    Bulk import the transactions of an uploaded bank CSV or OFX statement
+    """
+    form = TransactionImportForm()
+    form.default_category.choices = [('', 'None, reject the row')] + category_choices()
+    form.currency.choices = currency_choices()
+    if not form.currency.data:
+        form.currency.data = current_user.currency
+
+    if form.validate_on_submit():
+        upload = form.file.data
+        file_format = 'csv' if upload.filename.lower().endswith('.csv') else 'ofx'
+        error_dir = current_app.config['IMPORT_ERROR_DIR']
+        os.makedirs(error_dir, exist_ok=True)
+        error_name = f"{current_user.id}-{datetime.now():%Y%m%d-%H%M%S}.csv"
+        default_category = dict(form.default_category.choices).get(form.default_category.data) \
+            if form.default_category.data else None
+
+        stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+        report = import_transactions(stream, file_format, current_user.id,
+                                     error_path=os.path.join(error_dir, error_name),
+                                     default_category=default_category,
+                                     currency=form.currency.data)
+        log_audit('import_transactions', 'transaction',
+                  description=f'Imported {upload.filename}',
+                  details={'inserted': report.inserted, 'rejected': report.rejected,
+                           'rows_per_second': round(report.rows_per_second)})
+
+        if report.failed:
+            flash(f'{report}.', 'danger')
+        else:
+            flash(f'{report}.', 'success' if report.inserted else 'warning')
+        if report.error_path:
+            return render_template('transaction/import.html',
+                                   title='Import Transactions',
+                                   form=form, error_name=error_name,
+                                   TRANSACTION=True)
+        return redirect(url_for('transaction.index'))
+
+    return render_template('transaction/import.html',
+                           title='Import Transactions',
+                           form=form,
+                           TRANSACTION=True)
+
+
+
+@transaction_bp.route('/import/errors/<string:name>')
+@login_required
+def import_errors(name):
+    """
+    Download the rejected rows of one of the current user imports
+    """
+    if not name.startswith(f'{current_user.id}-'):
+        abort(404)
+    return send_from_directory(current_app.config['IMPORT_ERROR_DIR'], name,
+                               as_attachment=True)
+
+
+
 @transaction_bp.route('/create/', methods=['GET', 'POST'])
 @login_required
 # @require_permission('Role', 'create')
@@ -88,18 +191,27 @@ def create():
     Add New Transaction View
     """
     form = TransactionForm()
-    form.category.choices = [('', 'Select Category')] + [(c.id, c.name)
-                                                         for c in Category.query.all()]
+    form.category.choices = [('', 'Select Category')] + category_choices()
+    form.currency.choices = currency_choices()
+    if not form.currency.data:
+        form.currency.data = current_user.currency
 
     if request.method == 'POST':
         category = form.category.data
         amount = form.amount.data
+        currency = form.currency.data
         description = form.description.data
         transaction_type = form.transaction_type.data
 
+        # The amount is None when it is not a number or out of range
+        if amount is None:
+            flash('The amount is not a valid amount!', 'danger')
+            return redirect(url_for('transaction.index'))
+
         try:
             new_transaction = Transaction(category_id=category,
                                           amount=amount,
+                                          currency=currency,
                                           description=description,
                                           transaction_type=transaction_type,
                                           user_id=current_user.id)
@@ -128,19 +240,23 @@ def update(transaction_id):
     """
     item = Transaction.query.get_or_404(transaction_id)
     form = TransactionForm(obj=item)
-    form.category.choices = [(c.id, c.name) for c in Category.query.all()]
+    form.category.choices = category_choices()
+    form.currency.choices = currency_choices()
 
     if request.method == 'POST':
-        item.category_id = form.category.data
-        item.amount = form.amount.data
-        item.description = form.description.data
-        item.transaction_type = form.transaction_type.data
-
         error = None
+        # The amount is None when it is not a number or out of range
+        if form.amount.data is None:
+            error = 'The amount is not a valid amount!'
 
         if error:
             flash(error)
         else:
+            item.category_id = form.category.data
+            item.amount = form.amount.data
+            item.currency = form.currency.data
+            item.description = form.description.data
+            item.transaction_type = form.transaction_type.data
             try:
                 db.session.commit()
                 flash('Transaction is updated successfully!', 'success')
@@ -166,8 +282,9 @@ def delete(transaction_id):
     """
     item = Transaction.query.get_or_404(transaction_id)
     form = TransactionDetailsForm(obj=item)
-    form.category.choices = [(c.id, c.name) for c in Category.query.all()]
+    form.category.choices = category_choices()
     form.category.data = item.category_id
+    form.currency.choices = currency_choices()
 
     if request.method == 'POST':
         try:
@@ -0,0 +1,31 @@
+"""add row counts
+
+Revision ID: 191c8ed4b894
+Revises: e04b8dcf34c8
+Create Date: 2026-10-18 02:55:07.809791
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '191c8ed4b894'
+down_revision = 'e04b8dcf34c8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Counters are seeded with a COUNT(*) on their first read
+    op.create_table(
+        'row_counts',
+        sa.Column('table_name', sa.String(length=64), nullable=False),
+        sa.Column('count', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('table_name'),
+        if_not_exists=True
+    )
+
+
+def downgrade():
+    op.drop_table('row_counts')
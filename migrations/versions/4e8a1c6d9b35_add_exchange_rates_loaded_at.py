@@ -0,0 +1,41 @@
+"""add exchange rates loaded at
+
+Revision ID: 4e8a1c6d9b35
+Revises: 9d3b7e2c41a8
+Create Date: 2026-10-18 10:03:27.618402
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4e8a1c6d9b35'
+down_revision = '9d3b7e2c41a8'
+branch_labels = None
+depends_on = None
+
+
+def _has_column(table_name, column_name):
+    """
+    Whether the column exists already, the app creates the tables of its
+    models on start before the migrations run
+    """
+    columns = sa.inspect(op.get_bind()).get_columns(table_name)
+    return any(column['name'] == column_name for column in columns)
+
+
+def upgrade():
+    if not _has_column('exchange_rates', 'loaded_at'):
+        op.add_column('exchange_rates', sa.Column('loaded_at', sa.DateTime(), nullable=True))
+    # The rates loaded so far make up the first version
+    op.execute('UPDATE exchange_rates SET loaded_at = CURRENT_TIMESTAMP '
+               'WHERE loaded_at IS NULL')
+    op.create_index('ix_exchange_rates_loaded_at', 'exchange_rates', ['loaded_at'],
+                    if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_exchange_rates_loaded_at', table_name='exchange_rates',
+                  if_exists=True)
+    op.drop_column('exchange_rates', 'loaded_at')
@@ -0,0 +1,34 @@
+"""add transaction search index
+
+Revision ID: 5b470ac7d981
+Revises: dd542eceb84e
+Create Date: 2026-10-18 03:01:18.844657
+
+"""
+from alembic import op
+from app.services.fulltext import install_search_index
+from app.services.transaction_search import SEARCH_BACKFILL, SEARCH_DDL, SEARCH_DROP
+
+
+# revision identifiers, used by Alembic.
+revision = '5b470ac7d981'
+down_revision = 'dd542eceb84e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_transactions_amount', 'transactions', ['amount'], if_not_exists=True)
+
+    connection = op.get_bind()
+    # SQLite compiled without FTS5 keeps the ILIKE fallback of the search
+    if install_search_index(connection, SEARCH_DDL):
+        for statement in SEARCH_BACKFILL[connection.dialect.name]:
+            op.execute(statement)
+
+
+def downgrade():
+    for statement in SEARCH_DROP.get(op.get_bind().dialect.name, []):
+        op.execute(statement)
+
+    op.drop_index('ix_transactions_amount', table_name='transactions', if_exists=True)
@@ -0,0 +1,95 @@
+"""store amounts as integer cents
+
+Revision ID: 69e9dc78ee7d
+Revises: 5b470ac7d981
+Create Date: 2026-10-18 03:19:48.330052
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from app.services.fulltext import install_search_index
+from app.services.transaction_search import SEARCH_DDL
+
+
+# revision identifiers, used by Alembic.
+revision = '69e9dc78ee7d'
+down_revision = '5b470ac7d981'
+branch_labels = None
+depends_on = None
+
+
+AMOUNT_COLUMNS = [('transactions', 'amount'), ('monthly_summaries', 'total')]
+
+
+def _search_installed():
+    """
+    Return whether the SQLite search index of the transactions is installed
+    """
+    return op.get_bind().execute(sa.text(
+        "SELECT 1 FROM sqlite_master WHERE name = 'transactions_fts'")).first() is not None
+
+
+def _drop_sqlite_search_triggers():
+    """
+    Drop the search triggers, the categories one references the transactions
+    table and would make its rebuild fail
+    """
+    for trigger in ('insert', 'update', 'delete', 'category'):
+        op.execute(f'DROP TRIGGER IF EXISTS transactions_fts_{trigger}')
+
+
+def _restore_sqlite_search():
+    """
+    Recreate the search triggers on the rebuilt transactions table, the
+    index is keyed by the transaction ids the copied rows keep
+    """
+    install_search_index(op.get_bind(), SEARCH_DDL)
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    search = dialect == 'sqlite' and _search_installed()
+    if search:
+        _drop_sqlite_search_triggers()
+
+    for table_name, column_name in AMOUNT_COLUMNS:
+        if dialect == 'postgresql':
+            op.alter_column(table_name, column_name,
+                            existing_type=sa.Float(), type_=sa.BigInteger(),
+                            existing_nullable=False,
+                            postgresql_using=f'round({column_name}::numeric * 100)::bigint')
+            continue
+
+        op.execute(f'UPDATE {table_name} SET {column_name} = '
+                   f'CAST(ROUND({column_name} * 100) AS INTEGER)')
+        with op.batch_alter_table(table_name, recreate='always') as batch_op:
+            batch_op.alter_column(column_name,
+                                  existing_type=sa.Float(), type_=sa.BigInteger(),
+                                  existing_nullable=False)
+
+    if search:
+        _restore_sqlite_search()
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    search = dialect == 'sqlite' and _search_installed()
+    if search:
+        _drop_sqlite_search_triggers()
+
+    for table_name, column_name in AMOUNT_COLUMNS:
+        if dialect == 'postgresql':
+            op.alter_column(table_name, column_name,
+                            existing_type=sa.BigInteger(), type_=sa.Float(),
+                            existing_nullable=False,
+                            postgresql_using=f'{column_name} / 100.0')
+            continue
+
+        with op.batch_alter_table(table_name, recreate='always') as batch_op:
+            batch_op.alter_column(column_name,
+                                  existing_type=sa.BigInteger(), type_=sa.Float(),
+                                  existing_nullable=False)
+        op.execute(f'UPDATE {table_name} SET {column_name} = {column_name} / 100.0')
+
+    if search:
+        _restore_sqlite_search()
@@ -0,0 +1,36 @@
+"""add transactions indexes
+
+Revision ID: 7651f6cb813e
+Revises: 
+Create Date: 2026-10-18 02:49:44.929075
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '7651f6cb813e'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('ix_transactions_user_date', ['user_id', 'date']),
+    ('ix_transactions_user_type_date_amount',
+     ['user_id', 'transaction_type', 'date', 'amount']),
+    ('ix_transactions_user_created_at', ['user_id', 'created_at']),
+    ('ix_transactions_created_at', ['created_at']),
+    ('ix_transactions_category_id', ['category_id']),
+]
+
+
+def upgrade():
+    # Tables created by db.create_all() already carry the indexes
+    for name, columns in INDEXES:
+        op.create_index(name, 'transactions', columns, if_not_exists=True)
+
+
+def downgrade():
+    for name, _ in reversed(INDEXES):
+        op.drop_index(name, table_name='transactions', if_exists=True)
@@ -0,0 +1,42 @@
+"""key audit log search by id
+
+Revision ID: 9d3b7e2c41a8
+Revises: c58d2f9a1e63
+Create Date: 2026-10-18 09:12:44.351027
+
+"""
+from alembic import op
+from app.services.audit_search import SEARCH_BACKFILL, SEARCH_DDL, SEARCH_DROP
+from app.services.fulltext import install_search_index
+
+
+# revision identifiers, used by Alembic.
+revision = '9d3b7e2c41a8'
+down_revision = 'c58d2f9a1e63'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    connection = op.get_bind()
+    if connection.dialect.name != 'sqlite':
+        return
+
+    # The FTS5 rows were keyed by the auditlogs rowid that VACUUM renumbers,
+    # rebuild the index keyed through auditlogs_search_keys
+    found = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE name = 'auditlogs_fts'").first()
+    if found is None:
+        return
+    for statement in SEARCH_DROP['sqlite']:
+        op.execute(statement)
+    if install_search_index(connection, SEARCH_DDL):
+        for statement in SEARCH_BACKFILL['sqlite']:
+            op.execute(statement)
+
+
+def downgrade():
+    # The rowid keyed index is not restored, the search falls back to ILIKE
+    if op.get_bind().dialect.name == 'sqlite':
+        for statement in SEARCH_DROP['sqlite']:
+            op.execute(statement)
@@ -0,0 +1,112 @@
+"""add currencies and exchange rates
+
+Revision ID: a3c1e7b54f20
+Revises: 69e9dc78ee7d
+Create Date: 2026-10-18 04:02:11.284193
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3c1e7b54f20'
+down_revision = '69e9dc78ee7d'
+branch_labels = None
+depends_on = None
+
+
+# Rows written before currencies existed were all in the base currency
+DEFAULT_CURRENCY = 'USD'
+
+
+def _create_summaries(with_currency):
+    """
+    Create the monthly summaries table, keyed by currency or not, and
+    backfill it from the existing transactions
+    """
+    # The ttype enum already exists on PostgreSQL for the transactions table
+    ttype = sa.Enum('INCOME', 'EXPENSE', name='ttype').with_variant(
+        postgresql.ENUM('INCOME', 'EXPENSE', name='ttype', create_type=False),
+        'postgresql')
+    keys = ['user_id', 'year', 'month', 'category_id', 'transaction_type']
+    columns = [
+        sa.Column('user_id', sa.String(length=36), nullable=False),
+        sa.Column('year', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('month', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('category_id', sa.String(length=36), nullable=False),
+        sa.Column('transaction_type', ttype, nullable=False),
+    ]
+    if with_currency:
+        keys.append('currency')
+        columns.append(sa.Column('currency', sa.String(length=3), nullable=False))
+    summaries = op.create_table(
+        'monthly_summaries',
+        *columns,
+        sa.Column('total', sa.BigInteger(), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['category_id'], ['categories.id']),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint(*keys),
+    )
+
+    transactions = sa.table('transactions',
+                            sa.column('user_id'),
+                            sa.column('category_id'),
+                            sa.column('transaction_type'),
+                            sa.column('currency'),
+                            sa.column('date', sa.Date()),
+                            sa.column('amount'))
+    groups = [transactions.c.user_id,
+              sa.extract('year', transactions.c.date),
+              sa.extract('month', transactions.c.date),
+              transactions.c.category_id,
+              transactions.c.transaction_type]
+    if with_currency:
+        groups.append(transactions.c.currency)
+    op.execute(summaries.insert().from_select(
+        [*keys, 'total', 'count'],
+        sa.select(*groups, sa.func.sum(transactions.c.amount), sa.func.count())
+        .group_by(*groups)))
+
+
+def _has_column(table_name, column_name):
+    """
+    Whether the column exists already, the app creates the tables of its
+    models on start before the migrations run
+    """
+    columns = sa.inspect(op.get_bind()).get_columns(table_name)
+    return any(column['name'] == column_name for column in columns)
+
+
+def upgrade():
+    op.create_table(
+        'exchange_rates',
+        sa.Column('base', sa.String(length=3), nullable=False),
+        sa.Column('quote', sa.String(length=3), nullable=False),
+        sa.Column('date', sa.Date(), nullable=False),
+        sa.Column('rate', sa.Numeric(precision=20, scale=10), nullable=False),
+        sa.PrimaryKeyConstraint('base', 'quote', 'date'),
+        if_not_exists=True
+    )
+    for table_name in ('transactions', 'users'):
+        if not _has_column(table_name, 'currency'):
+            op.add_column(table_name, sa.Column('currency', sa.String(length=3),
+                                                nullable=False,
+                                                server_default=DEFAULT_CURRENCY))
+
+    # The currency joins the summary key, rebuild the summaries per currency
+    op.drop_table('monthly_summaries')
+    _create_summaries(with_currency=True)
+
+
+def downgrade():
+    # Summaries of several currencies cannot be merged, rebuild them summing
+    # the amounts as they are
+    op.drop_table('monthly_summaries')
+    _create_summaries(with_currency=False)
+
+    op.drop_column('users', 'currency')
+    op.drop_column('transactions', 'currency')
+    op.drop_table('exchange_rates')
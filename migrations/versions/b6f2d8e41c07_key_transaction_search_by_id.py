@@ -0,0 +1,42 @@
+"""key transaction search by id
+
+Revision ID: b6f2d8e41c07
+Revises: 4e8a1c6d9b35
+Create Date: 2026-10-18 11:24:05.718390
+
+"""
+from alembic import op
+from app.services.fulltext import install_search_index
+from app.services.transaction_search import SEARCH_BACKFILL, SEARCH_DDL, SEARCH_DROP
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6f2d8e41c07'
+down_revision = '4e8a1c6d9b35'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    connection = op.get_bind()
+    if connection.dialect.name != 'sqlite':
+        return
+
+    # The FTS5 rows were keyed by the transactions rowid that VACUUM
+    # renumbers, rebuild the index keyed through transactions_search_keys
+    found = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE name = 'transactions_fts'").first()
+    if found is None:
+        return
+    for statement in SEARCH_DROP['sqlite']:
+        op.execute(statement)
+    if install_search_index(connection, SEARCH_DDL):
+        for statement in SEARCH_BACKFILL['sqlite']:
+            op.execute(statement)
+
+
+def downgrade():
+    # The rowid keyed index is not restored, the search falls back to ILIKE
+    if op.get_bind().dialect.name == 'sqlite':
+        for statement in SEARCH_DROP['sqlite']:
+            op.execute(statement)
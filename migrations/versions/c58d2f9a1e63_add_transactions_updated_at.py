@@ -0,0 +1,40 @@
+"""add transactions updated at
+
+Revision ID: c58d2f9a1e63
+Revises: a3c1e7b54f20
+Create Date: 2026-10-18 04:41:37.902615
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c58d2f9a1e63'
+down_revision = 'a3c1e7b54f20'
+branch_labels = None
+depends_on = None
+
+
+def _has_column(table_name, column_name):
+    """
+    Whether the column exists already, the app creates the tables of its
+    models on start before the migrations run
+    """
+    columns = sa.inspect(op.get_bind()).get_columns(table_name)
+    return any(column['name'] == column_name for column in columns)
+
+
+def upgrade():
+    if not _has_column('transactions', 'updated_at'):
+        op.add_column('transactions', sa.Column('updated_at', sa.DateTime(), nullable=True))
+        # Existing transactions were last changed at the latest when created
+        op.execute('UPDATE transactions SET updated_at = created_at')
+    op.create_index('ix_transactions_user_updated_at', 'transactions',
+                    ['user_id', 'updated_at'], if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_transactions_user_updated_at', table_name='transactions',
+                  if_exists=True)
+    op.drop_column('transactions', 'updated_at')
@@ -0,0 +1,30 @@
+"""add cache versions
+
+Revision ID: d41f7a9c2e58
+Revises: b6f2d8e41c07
+Create Date: 2026-10-18 12:08:51.403926
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd41f7a9c2e58'
+down_revision = 'b6f2d8e41c07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'cache_versions',
+        sa.Column('name', sa.String(length=64), nullable=False),
+        sa.Column('version', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('name'),
+        if_not_exists=True
+    )
+
+
+def downgrade():
+    op.drop_table('cache_versions')
@@ -0,0 +1,30 @@
+"""add audit log search index
+
+Revision ID: dd542eceb84e
+Revises: f4f730b1b35a
+Create Date: 2026-10-18 02:59:39.593104
+
+"""
+from alembic import op
+from app.services.audit_search import SEARCH_BACKFILL, SEARCH_DDL, SEARCH_DROP
+from app.services.fulltext import install_search_index
+
+
+# revision identifiers, used by Alembic.
+revision = 'dd542eceb84e'
+down_revision = 'f4f730b1b35a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    connection = op.get_bind()
+    # SQLite compiled without FTS5 keeps the ILIKE fallback of the search
+    if install_search_index(connection, SEARCH_DDL):
+        for statement in SEARCH_BACKFILL[connection.dialect.name]:
+            op.execute(statement)
+
+
+def downgrade():
+    for statement in SEARCH_DROP.get(op.get_bind().dialect.name, []):
+        op.execute(statement)
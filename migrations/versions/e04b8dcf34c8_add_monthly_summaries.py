@@ -0,0 +1,61 @@
+"""add monthly summaries
+
+Revision ID: e04b8dcf34c8
+Revises: f7fbbd72b853
+Create Date: 2026-10-18 02:52:17.515777
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'e04b8dcf34c8'
+down_revision = 'f7fbbd72b853'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The ttype enum already exists on PostgreSQL for the transactions table
+    ttype = sa.Enum('INCOME', 'EXPENSE', name='ttype').with_variant(
+        postgresql.ENUM('INCOME', 'EXPENSE', name='ttype', create_type=False),
+        'postgresql')
+    summaries = op.create_table(
+        'monthly_summaries',
+        sa.Column('user_id', sa.String(length=36), nullable=False),
+        sa.Column('year', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('month', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('category_id', sa.String(length=36), nullable=False),
+        sa.Column('transaction_type', ttype, nullable=False),
+        sa.Column('total', sa.Float(), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['category_id'], ['categories.id']),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('user_id', 'year', 'month', 'category_id',
+                                'transaction_type'),
+        if_not_exists=True
+    )
+
+    # Backfill the summaries from the existing transactions
+    transactions = sa.table('transactions',
+                            sa.column('user_id'),
+                            sa.column('category_id'),
+                            sa.column('transaction_type'),
+                            sa.column('date', sa.Date()),
+                            sa.column('amount'))
+    year = sa.extract('year', transactions.c.date)
+    month = sa.extract('month', transactions.c.date)
+    op.execute(summaries.delete())
+    op.execute(summaries.insert().from_select(
+        ['user_id', 'year', 'month', 'category_id', 'transaction_type', 'total', 'count'],
+        sa.select(transactions.c.user_id, year, month, transactions.c.category_id,
+                  transactions.c.transaction_type, sa.func.sum(transactions.c.amount),
+                  sa.func.count())
+        .group_by(transactions.c.user_id, year, month, transactions.c.category_id,
+                  transactions.c.transaction_type)))
+
+
+def downgrade():
+    op.drop_table('monthly_summaries')
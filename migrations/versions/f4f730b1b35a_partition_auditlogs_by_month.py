@@ -0,0 +1,101 @@
+"""partition auditlogs by month
+
+Revision ID: f4f730b1b35a
+Revises: 191c8ed4b894
+Create Date: 2026-10-18 02:57:26.890735
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'f4f730b1b35a'
+down_revision = '191c8ed4b894'
+branch_labels = None
+depends_on = None
+
+
+COLUMNS = ('id, timestamp, user_id, action, resource_type, resource_id, description, '
+           'ip_address, user_agent, request_id, details, created_at, created_by, '
+           'updated_at, updated_by')
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        # Other databases keep a single hot table indexed on created_at
+        op.create_index('ix_auditlogs_created_at', 'auditlogs', ['created_at'],
+                        if_not_exists=True)
+        return
+
+    # Rebuild auditlogs as a table partitioned by month on created_at, the
+    # partition key has to be part of the primary key
+    op.execute('ALTER TABLE auditlogs RENAME TO auditlogs_legacy')
+    op.execute("""
+        CREATE TABLE auditlogs (
+            id VARCHAR(36) NOT NULL,
+            timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            user_id VARCHAR(50),
+            action VARCHAR(100) NOT NULL,
+            resource_type VARCHAR(50),
+            resource_id VARCHAR(50),
+            description TEXT,
+            ip_address VARCHAR(50),
+            user_agent VARCHAR(200),
+            request_id VARCHAR(36) NOT NULL,
+            details TEXT,
+            created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            created_by VARCHAR(36) NOT NULL,
+            updated_at TIMESTAMP WITHOUT TIME ZONE,
+            updated_by VARCHAR(36) NOT NULL,
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """)
+    op.execute('CREATE TABLE auditlogs_default PARTITION OF auditlogs DEFAULT')
+    op.execute("""
+        DO $$
+        DECLARE
+            month_start DATE := date_trunc('month', COALESCE(
+                (SELECT min(created_at) FROM auditlogs_legacy), now()));
+        BEGIN
+            WHILE month_start <= date_trunc('month', now()) + interval '2 months' LOOP
+                EXECUTE format(
+                    'CREATE TABLE auditlogs_%s PARTITION OF auditlogs '
+                    'FOR VALUES FROM (%L) TO (%L)',
+                    to_char(month_start, 'YYYY_MM'), month_start,
+                    month_start + interval '1 month');
+                month_start := month_start + interval '1 month';
+            END LOOP;
+        END $$
+    """)
+    op.execute(f'INSERT INTO auditlogs ({COLUMNS}) SELECT {COLUMNS} FROM auditlogs_legacy')
+    op.execute('DROP TABLE auditlogs_legacy')
+    op.create_index('ix_auditlogs_created_at', 'auditlogs', ['created_at'])
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        op.drop_index('ix_auditlogs_created_at', table_name='auditlogs', if_exists=True)
+        return
+
+    op.execute('ALTER TABLE auditlogs RENAME TO auditlogs_partitioned')
+    op.execute("""
+        CREATE TABLE auditlogs (
+            id VARCHAR(36) PRIMARY KEY,
+            timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            user_id VARCHAR(50),
+            action VARCHAR(100) NOT NULL,
+            resource_type VARCHAR(50),
+            resource_id VARCHAR(50),
+            description TEXT,
+            ip_address VARCHAR(50),
+            user_agent VARCHAR(200),
+            request_id VARCHAR(36) NOT NULL,
+            details TEXT,
+            created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            created_by VARCHAR(36) NOT NULL,
+            updated_at TIMESTAMP WITHOUT TIME ZONE,
+            updated_by VARCHAR(36) NOT NULL
+        )
+    """)
+    op.execute(f'INSERT INTO auditlogs ({COLUMNS}) SELECT {COLUMNS} FROM auditlogs_partitioned')
+    op.execute('DROP TABLE auditlogs_partitioned CASCADE')
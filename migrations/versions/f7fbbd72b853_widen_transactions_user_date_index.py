@@ -0,0 +1,30 @@
+"""widen transactions user date index
+
+Revision ID: f7fbbd72b853
+Revises: 7651f6cb813e
+Create Date: 2026-10-18 02:50:56.077981
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'f7fbbd72b853'
+down_revision = '7651f6cb813e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_transactions_user_date_type_amount', 'transactions',
+                    ['user_id', 'date', 'transaction_type', 'amount'],
+                    if_not_exists=True)
+    op.drop_index('ix_transactions_user_date', table_name='transactions',
+                  if_exists=True)
+
+
+def downgrade():
+    op.create_index('ix_transactions_user_date', 'transactions',
+                    ['user_id', 'date'], if_not_exists=True)
+    op.drop_index('ix_transactions_user_date_type_amount',
+                  table_name='transactions', if_exists=True)
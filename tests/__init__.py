@@ -0,0 +1,5 @@
+"""
+Test package of the application
+"""
+
+# End of file
@@ -0,0 +1,50 @@
+"""
+Shared pytest fixtures, an application on a throwaway SQLite database
+"""
+
+import pytest
+from app import create_app
+from app.extensions import db
+from app.models.user import User
+from config import TestingConfig, config
+
+ADMIN_PASSWORD = 'SuperMan@123.?'
+
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    """
+    A function to create the application on a database of the test session
+    """
+    path = tmp_path_factory.mktemp('db') / 'test.db'
+    config['pytest'] = type('PytestConfig', (TestingConfig,), {
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}',
+        'WTF_CSRF_ENABLED': False,
+    })
+    app = create_app('pytest')
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture(scope='session')
+def admin(app):
+    """
+    A function to return the id and email of the default admin user
+    """
+    with app.app_context():
+        user = User.query.filter_by(username='superadmin').one()
+        return user.id, user.email
+
+
+@pytest.fixture
+def client(app, admin):
+    """
+    A function to return a test client logged in as the admin user
+    """
+    client = app.test_client()
+    client.post('/auth/login/', data={'email': admin[1], 'password': ADMIN_PASSWORD})
+    return client
+
+# End of file
@@ -0,0 +1,92 @@
+"""
+Multi-process log rotation tests, no line may be lost, duplicated or
+interleaved across the rotations
+"""
+
+import glob
+import json
+import logging
+import multiprocessing
+import pytest
+from app.utils.logging import MultiProcessRotatingFileHandler
+
+WORKERS = 4
+LINES = 1000
+MAX_BYTES = 16 * 1024
+
+
+def _handler(path):
+    """
+    A function to create the rotating handler of the test log
+    """
+    handler = MultiProcessRotatingFileHandler(path, maxBytes=MAX_BYTES, backupCount=100_000)
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
+    return handler
+
+
+def _worker(path, worker, handler=None):
+    """
+    A function to write numbered lines to the shared log from one process,
+    through its own handler or one inherited from the parent process
+    """
+    logger = logging.getLogger(f'rotation-test-{worker}')
+    logger.propagate = False
+    handler = handler or _handler(path)
+    logger.addHandler(handler)
+    for line in range(LINES):
+        logger.warning(json.dumps({'worker': worker, 'line': line}))
+    handler.close()
+
+
+def _read_lines(path):
+    """
+    A function to return the (worker, line) keys of every log file, and the
+    counts of the malformed and duplicated lines
+    """
+    seen = set()
+    malformed = duplicated = 0
+    for name in glob.glob(str(path) + '*'):
+        if name.endswith('.lock'):
+            continue
+        with open(name, encoding='utf-8') as log_file:
+            for text in log_file:
+                try:
+                    entry = json.loads(text.split(' - ', 1)[1])
+                    key = (entry['worker'], entry['line'])
+                except (IndexError, ValueError, KeyError):
+                    malformed += 1
+                    continue
+                duplicated += key in seen
+                seen.add(key)
+    return seen, malformed, duplicated
+
+
+@pytest.mark.parametrize('preload', [False, True], ids=['per-process', 'preload'])
+def test_rotation_keeps_every_line(tmp_path, preload):
+    path = tmp_path / 'audit.log'
+    expected = {(worker, line) for worker in range(WORKERS) for line in range(LINES)}
+
+    # With preload the forked processes inherit the handler of the parent,
+    # which writes before forking as a gunicorn --preload application does
+    context = multiprocessing.get_context('fork')
+    handler = _handler(str(path)) if preload else None
+    if handler is not None:
+        handler.emit(logging.makeLogRecord({'msg': json.dumps({'worker': 'parent', 'line': 0})}))
+        expected.add(('parent', 0))
+
+    processes = [context.Process(target=_worker, args=(str(path), worker, handler))
+                 for worker in range(WORKERS)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    if handler is not None:
+        handler.close()
+
+    assert all(process.exitcode == 0 for process in processes)
+    seen, malformed, duplicated = _read_lines(path)
+    assert (malformed, duplicated) == (0, 0)
+    assert seen == expected
+    assert len(glob.glob(str(path) + '.*[0-9]')) > 1
+
+# End of file
@@ -0,0 +1,42 @@
+"""
+Query plan tests of the dashboard period summaries
+"""
+
+from datetime import date
+import pytest
+from app.extensions import db
+from app.services.summary import period_summary_statement
+from app.utils.periods import month_range
+
+INDEX = 'ix_transactions_user_date_type_amount'
+
+
+def _query_plan(statement):
+    """
+    A function to return the EXPLAIN QUERY PLAN details of a statement
+    """
+    sql = statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+    rows = db.session.execute(db.text(f'EXPLAIN QUERY PLAN {sql}')).all()
+    return [row[-1] for row in rows]
+
+
+@pytest.mark.parametrize('currency', [None, 'USD'])
+def test_period_summary_searches_user_date_index(app, admin, currency):
+    start, end = month_range(date(2026, 10, 18))
+    with app.app_context():
+        plan = _query_plan(period_summary_statement(admin[0], start, end, currency))
+
+    transactions = [detail for detail in plan if 'transactions' in detail.split()[:2]]
+    assert transactions, plan
+    assert transactions[0].startswith('SEARCH'), plan
+    assert f'INDEX {INDEX} (user_id=? AND date>? AND date<?)' in transactions[0], plan
+
+
+def test_period_summary_without_conversion_is_index_only(app, admin):
+    start, end = month_range(date(2026, 10, 18))
+    with app.app_context():
+        plan = _query_plan(period_summary_statement(admin[0], start, end))
+
+    assert any(f'COVERING INDEX {INDEX}' in detail for detail in plan), plan
+
+# End of file
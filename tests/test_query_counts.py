@@ -0,0 +1,51 @@
+"""
+N+1 query tests of the listing and dashboard pages
+"""
+
+from flask import g, request_finished
+import pytest
+from app.extensions import db
+from app.models.category import Category
+from app.models.transaction import Transaction
+
+
+def _add_transactions(app, user_id, count):
+    """
+    A function to add transactions of the user spread over every category
+    """
+    with app.app_context():
+        categories = Category.query.all()
+        for index in range(count):
+            db.session.add(Transaction(category_id=categories[index % len(categories)].id,
+                                       amount=index + 1, description=f'query count {index}',
+                                       transaction_type='EXPENSE' if index % 2 else 'INCOME',
+                                       user_id=user_id))
+        db.session.commit()
+
+
+def _statement_count(app, client, path):
+    """
+    A function to return the SQL statements run by a request, counted by the
+    query guard, after a first request warming the caches
+    """
+    counts = []
+
+    def record(sender, response, **extra):
+        counts.append(g.get('sql_statements', 0))
+
+    client.get(path)
+    with request_finished.connected_to(record, app):
+        response = client.get(path)
+    assert response.status_code == 200
+    return counts[-1]
+
+
+@pytest.mark.parametrize('path', ['/transactions/index/?page_size=100', '/app/dashboard/'])
+def test_statement_count_does_not_grow_with_rows(app, admin, client, path):
+    _add_transactions(app, admin[0], 5)
+    small = _statement_count(app, client, path)
+    _add_transactions(app, admin[0], 40)
+    large = _statement_count(app, client, path)
+    assert small == large
+
+# End of file